@@ -4,24 +4,43 @@ Telegram Bot for Barber Shop - Salon Booking System
 Production-ready implementation with calendar scheduling, master management, and ratings
 """
 
+from time import perf_counter
+
+_MODULE_IMPORT_STARTED = perf_counter()
+
 import logging
 import json
+import argparse
 import asyncio
+import calendar
+import csv
+import gc
+import gzip
+import io
+import itertools
+import os
 import re
-import calendar as cal_module
-from datetime import datetime, timedelta
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta, time as dt_time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial
 from typing import Dict, List, Optional
-import pytz
+from zoneinfo import ZoneInfo
 
 from telegram import (
     Update, InlineKeyboardButton, InlineKeyboardMarkup,
-    ReplyKeyboardMarkup, KeyboardButton, WebAppInfo
+    ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton, WebAppInfo
 )
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, 
     MessageHandler, ConversationHandler, ContextTypes, filters
 )
 from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
 
 # Configure logging
 logging.basicConfig(
@@ -59,6 +78,7 @@ CONFIG = {
         "address": "Азовская улица, 4, 1 этаж",
         "city": "Москва",
         "phone": "+7 (999) 123-45-67",
+        "timezone": "Europe/Moscow",
         "working_hours": {
             "start": "08:00",
             "end": "18:00",
@@ -67,9 +87,115 @@ CONFIG = {
         }
     },
     "payments": ["cash", "card", "online"],
-    "web_app_url": "https://charodeyka-booking.netlify.app"  # Mini App URL
+    "web_app_url": "https://charodeyka-booking.netlify.app",  # Mini App URL
+    "storage": {
+        "dir": "data",                 # Journal and snapshot location
+        "fsync_window": 0.05,          # Seconds to batch journal fsyncs
+        "snapshot_interval": 600,      # Seconds between periodic snapshots
+        "archive_time": "00:05"        # Daily move of past bookings to archive
+    },
+    "waitlist": {
+        "hold_minutes": 10             # How long a freed slot is held for an offer
+    },
+    "notifications": {
+        "coalesce_seconds": 60,        # Quiet period before a master's changes are sent
+        "coalesce_max_seconds": 300,   # Upper bound on delay under a steady stream of changes
+        "digest_time": "07:30",        # Daily agenda for masters
+        "send_batch": 25               # Messages per second for bulk sends (Telegram allows ~30)
+    },
+    "ratings": {
+        "prompt_after_minutes": 90,    # Ask for a rating this long after the booking start
+        "check_interval": 600,         # Seconds between scans for finished visits
+        "answer_days": 7,              # Unanswered prompts expire after this
+        "half_life_days": 90           # Weight of a review halves every N days
+    }
 }
 
+# ========================
+# CLOCK & DATES
+# ========================
+
+# Internally dates are date ordinals (int) and times are slot indices (int);
+# "YYYY-MM-DD" / "HH:MM" strings exist only in stored bookings and rendered text.
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOT_TIMES = [f"{slot * SLOT_MINUTES // 60:02d}:{slot * SLOT_MINUTES % 60:02d}"
+              for slot in range(SLOTS_PER_DAY)]
+
+
+class Clock:
+    """Salon-local clock: the single source of "now" and "today"
+
+    Swap with `set_clock()` to control time in tests and benchmarks.
+    """
+    
+    def __init__(self, tz_name: str):
+        self.tz = ZoneInfo(tz_name)
+    
+    def now(self) -> datetime:
+        """Current aware datetime in salon timezone"""
+        return datetime.now(self.tz)
+    
+    def today(self) -> int:
+        """Today's date ordinal in salon timezone"""
+        return self.now().toordinal()
+    
+    def current_slot(self) -> int:
+        """Slot index containing the current salon time"""
+        now = self.now()
+        return (now.hour * 60 + now.minute) // SLOT_MINUTES
+
+
+class FixedClock(Clock):
+    """Manually driven clock"""
+    
+    def __init__(self, tz_name: str, start: datetime):
+        super().__init__(tz_name)
+        self._now = start if start.tzinfo else start.replace(tzinfo=self.tz)
+    
+    def now(self) -> datetime:
+        return self._now
+    
+    def advance(self, **delta):
+        """Move time forward by timedelta(**delta)"""
+        self._now += timedelta(**delta)
+
+
+clock = Clock(CONFIG["salon_info"]["timezone"])
+
+
+def set_clock(new_clock: Clock):
+    """Replace the global clock"""
+    global clock
+    clock = new_clock
+
+
+@lru_cache(maxsize=8192)
+def parse_date(date_str: str) -> int:
+    """ISO "YYYY-MM-DD" string -> date ordinal"""
+    return date.fromisoformat(date_str).toordinal()
+
+
+@lru_cache(maxsize=8192)
+def iso_date(ordinal: int) -> str:
+    """Date ordinal -> ISO "YYYY-MM-DD" string"""
+    return date.fromordinal(ordinal).isoformat()
+
+
+@lru_cache(maxsize=None)
+def parse_time(time_str: str) -> int:
+    """Clock "HH:MM" string -> slot index"""
+    hours, minutes = time_str.split(":")
+    return (int(hours) * 60 + int(minutes)) // SLOT_MINUTES
+
+
+@lru_cache(maxsize=8192)
+def format_date(ordinal: int, fmt: str = "%d.%m.%Y") -> str:
+    """Render date ordinal for display"""
+    return date.fromordinal(ordinal).strftime(fmt)
+
+
 # ========================
 # GLOBAL STATE
 # ========================
@@ -82,6 +208,1106 @@ master_schedules: Dict = {}
 analytics_data: Dict = {}
 user_roles: Dict = {}  # Track user role: 'client', 'master', 'admin'
 
+# Derived indexes (rebuilt from `bookings` on startup, never persisted)
+slot_index: Dict = {}          # (master, date ordinal) -> {slot: booking_id}
+user_bookings_index: Dict = {}  # user_id -> set of booking_ids
+
+# Waitlist: entries are journaled, holds on offered slots are transient
+waitlist: Dict = {}            # entry_id -> entry
+waitlist_index: Dict = {}      # (master or "*", date ordinal) -> [entry_id, ...] in FCFS order
+user_waitlist_index: Dict = {}  # user_id -> set of entry_ids
+slot_holds: Dict = {}          # (master, date ordinal) -> {slot: hold_id}
+holds: Dict = {}               # hold_id -> hold
+# Seeded from the clock so stale offer buttons never match a hold after restart
+_hold_ids = itertools.count(int(datetime.now().timestamp()))
+
+# Client lookup (rebuilt from `client_data` on startup)
+phone_index: Dict = {}            # normalized phone -> user_id
+client_search_index: List = []    # sorted (name word or phone digits, user_id) for prefix search
+
+# Ratings: reviews and prompts are journaled, aggregates are updated as reviews arrive
+reviews: Dict = {}             # booking_id -> review
+pending_ratings: Dict = {}     # booking_id -> prompt sent after the visit
+master_ratings: Dict = {}      # master -> running sums, see add_rating()
+
+# Working slots per (master, date) from schedule rules, before bookings/holds
+availability_cache: Dict = {}  # (master, date ordinal) -> tuple of slots
+
+# Booking changes waiting to be sent to masters as one message (transient)
+pending_notifications: Dict = {}  # master -> {"first": datetime, "events": {booking_id: event}}
+
+# ========================
+# BOOKING JOURNAL
+# ========================
+
+# Field order for compact booking rows in the journal and snapshots
+BOOKING_FIELDS = ("id", "user_id", "service", "master", "date", "time",
+                  "price", "status", "created_at")
+
+
+def booking_to_row(booking: Dict) -> list:
+    """Pack booking dict into a compact positional row"""
+    return [booking[field] for field in BOOKING_FIELDS]
+
+
+def booking_from_row(row: list) -> Dict:
+    """Unpack compact positional row into a booking dict"""
+    return dict(zip(BOOKING_FIELDS, row))
+
+
+class BookingJournal:
+    """Append-only write-ahead journal of booking state transitions
+
+    Every state change is written as one compact JSON line before it is
+    applied in memory. Writes go straight to the OS; fsyncs are batched
+    within `fsync_window` and run off the event loop, so confirmations
+    never wait on the disk. A snapshot rotates the journal to
+    `journal.<seq>.log` on the event loop, then writes the full state in a
+    snapshot thread, one at a time; rotated files it covers are
+    deleted once it is on disk.
+    """
+
+    def __init__(self, directory: str, fsync_window: float = 0.05):
+        self.directory = directory
+        self.journal_path = os.path.join(directory, "journal.log")
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+        self.fsync_window = fsync_window
+        self.seq = 0
+        self.records_since_snapshot = 0
+        self._file = None
+        self._sync_pending = False
+        self._valid_length = None  # Bytes of whole records found by read_tail
+        self.snapshot_seq = 0  # Seq of the snapshot on disk
+        self.snapshot_pending = None  # Future of the last submitted snapshot
+        self._snapshot_lock = threading.Lock()
+
+    def open(self):
+        """Open journal for appending, cutting off a torn tail left by a crash"""
+        os.makedirs(self.directory, exist_ok=True)
+        if (self._valid_length is not None and os.path.exists(self.journal_path)
+                and os.path.getsize(self.journal_path) > self._valid_length):
+            # New records must not be glued onto the broken line
+            logger.warning(f"Journal: discarding torn tail after byte {self._valid_length}")
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(self._valid_length)
+                f.flush()
+                os.fsync(f.fileno())
+        self._valid_length = None
+        self._file = open(self.journal_path, "a", encoding="utf-8")
+
+    def close(self):
+        """Flush, fsync and close the journal"""
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def append(self, op: str, **fields) -> Dict:
+        """Write a record and schedule a batched fsync"""
+        self.seq += 1
+        self.records_since_snapshot += 1
+        record = {"s": self.seq, "op": op, **fields}
+        if self._file is not None:
+            self._file.write(
+                json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            )
+            self._schedule_sync()
+        return record
+
+    def sync(self):
+        """Flush and fsync synchronously"""
+        self._sync_pending = False
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _schedule_sync(self):
+        if self._sync_pending:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.sync()
+            return
+        self._sync_pending = True
+        loop.call_later(self.fsync_window, self._background_sync, loop)
+
+    def _background_sync(self, loop):
+        self._sync_pending = False
+        if self._file is None:
+            return
+        self._file.flush()
+        loop.run_in_executor(None, _fsync_quietly, self._file)
+
+    def rotated_files(self) -> List:
+        """(seq, path) of journals rotated out by snapshots, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in os.listdir(self.directory):
+            match = re.fullmatch(r"journal\.(\d+)\.log", name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def rotate(self) -> int:
+        """Move current records aside for the next snapshot; returns their last seq"""
+        if self._file is not None:
+            self._file.close()  # Flushes; write_snapshot fsyncs it off the loop
+            os.replace(self.journal_path, os.path.join(self.directory, f"journal.{self.seq}.log"))
+            self._file = open(self.journal_path, "a", encoding="utf-8")
+        self.records_since_snapshot = 0
+        return self.seq
+
+    @property
+    def snapshot_running(self) -> bool:
+        return self.snapshot_pending is not None and not self.snapshot_pending.done()
+
+    def submit_snapshot(self, build_document):
+        """Rotate the journal and write `build_document()` in a snapshot thread"""
+        self.wait_for_snapshot()
+        seq = self.rotate()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot")
+        self.snapshot_pending = executor.submit(lambda: self.write_snapshot(seq, build_document()))
+        executor.shutdown(wait=False)  # Thread exits once the snapshot is written
+        return self.snapshot_pending
+
+    def wait_for_snapshot(self):
+        """Block until the snapshot in flight, if any, has finished"""
+        if self.snapshot_pending is None:
+            return
+        try:
+            self.snapshot_pending.result()
+        except Exception:
+            logger.exception("Journal: background snapshot failed")
+
+    def write_snapshot(self, seq: int, state: Dict):
+        """Atomically persist full state as of `seq` (safe to run in a worker thread)"""
+        os.makedirs(self.directory, exist_ok=True)
+        rotated = [path for file_seq, path in self.rotated_files() if file_seq <= seq]
+        for path in rotated:
+            # Keep the records durable in case the snapshot below fails
+            with open(path, "rb") as f:
+                os.fsync(f.fileno())
+        tmp_path = os.path.join(self.directory, f"snapshot.{seq}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"seq": seq, **state}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        with self._snapshot_lock:
+            if seq < self.snapshot_seq:
+                # A newer snapshot already landed and dropped its rotated journals
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, self.snapshot_path)
+            self.snapshot_seq = seq
+        # Records up to `seq` now live in the snapshot
+        for path in rotated:
+            os.remove(path)
+
+    def load_snapshot(self) -> Optional[Dict]:
+        """Load latest snapshot, if any"""
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if re.fullmatch(r"snapshot\.\d+\.tmp", name):  # Crashed mid-write
+                    os.remove(os.path.join(self.directory, name))
+        if not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        self.seq = self.snapshot_seq = snapshot.get("seq", 0)
+        return snapshot
+
+    def read_tail(self, after_seq: int):
+        """Yield journal records newer than `after_seq`, rotated files first"""
+        # Rotated journals outlive a snapshot that never reached the disk
+        paths = [path for _, path in self.rotated_files()] + [self.journal_path]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            valid_length = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("record without newline")
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash - everything after is lost
+                        logger.warning(f"Journal: truncated record in {path}, stopping replay")
+                        break
+                    valid_length += len(line)
+                    self.seq = max(self.seq, record["s"])
+                    if record["s"] > after_seq:
+                        self.records_since_snapshot += 1
+                        yield record
+            if path == self.journal_path:
+                self._valid_length = valid_length
+
+
+def _fsync_quietly(file):
+    """fsync from a worker thread; the file may have been closed meanwhile"""
+    try:
+        os.fsync(file.fileno())
+    except (OSError, ValueError):
+        pass
+
+
+journal = BookingJournal(CONFIG["storage"]["dir"], CONFIG["storage"]["fsync_window"])
+
+
+def index_booking(booking: Dict):
+    """Add booking to occupancy, per-user and analytics indexes"""
+    user_bookings_index.setdefault(booking["user_id"], set()).add(booking["id"])
+    if booking["status"] != "confirmed":
+        return
+    key = (booking["master"], parse_date(booking["date"]))
+    slot_index.setdefault(key, {})[parse_time(booking["time"])] = booking["id"]
+
+    stats = master_stats.setdefault(booking["master"], {"bookings": 0, "revenue": 0})
+    stats["bookings"] += 1
+    stats["revenue"] += booking["price"]
+    analytics_data["total_bookings"] = analytics_data.get("total_bookings", 0) + 1
+    analytics_data["total_revenue"] = analytics_data.get("total_revenue", 0) + booking["price"]
+
+
+def unindex_booking(booking: Dict):
+    """Remove booking from all derived indexes"""
+    user_ids = user_bookings_index.get(booking["user_id"])
+    if user_ids is not None:
+        user_ids.discard(booking["id"])
+    if booking["status"] != "confirmed":
+        return
+    key = (booking["master"], parse_date(booking["date"]))
+    slot = parse_time(booking["time"])
+    day_slots = slot_index.get(key)
+    if day_slots is not None and day_slots.get(slot) == booking["id"]:
+        del day_slots[slot]
+        if not day_slots:
+            del slot_index[key]
+
+    stats = master_stats[booking["master"]]
+    stats["bookings"] -= 1
+    stats["revenue"] -= booking["price"]
+    analytics_data["total_bookings"] -= 1
+    analytics_data["total_revenue"] -= booking["price"]
+
+
+def rebuild_indexes():
+    """Rebuild all derived indexes from `bookings` in a single pass"""
+    slot_index.clear()
+    user_bookings_index.clear()
+    master_stats.clear()
+    total_bookings = 0
+    total_revenue = 0
+    # Lifetime stats start from the archived history
+    for master_name, (count, revenue) in archive.master_totals.items():
+        master_stats[master_name] = {"bookings": count, "revenue": revenue}
+        total_bookings += count
+        total_revenue += revenue
+    for booking_id, booking in bookings.items():
+        user_ids = user_bookings_index.get(booking["user_id"])
+        if user_ids is None:
+            user_ids = user_bookings_index[booking["user_id"]] = set()
+        user_ids.add(booking_id)
+        if booking["status"] != "confirmed":
+            continue
+        key = (booking["master"], parse_date(booking["date"]))
+        day_slots = slot_index.get(key)
+        if day_slots is None:
+            day_slots = slot_index[key] = {}
+        day_slots[parse_time(booking["time"])] = booking_id
+        stats = master_stats.get(booking["master"])
+        if stats is None:
+            stats = master_stats[booking["master"]] = {"bookings": 0, "revenue": 0}
+        stats["bookings"] += 1
+        stats["revenue"] += booking["price"]
+        total_bookings += 1
+        total_revenue += booking["price"]
+    analytics_data["total_bookings"] = total_bookings
+    analytics_data["total_revenue"] = total_revenue
+
+
+def apply_journal_record(record: Dict, reindex: bool = True):
+    """Apply one journal record to in-memory state"""
+    op = record["op"]
+    if op == "book":
+        booking = booking_from_row(record["b"])
+        old = bookings.get(booking["id"])
+        if old is None:
+            set_last_booking(booking)
+        elif reindex:
+            unindex_booking(old)
+        bookings[booking["id"]] = booking
+        if reindex:
+            index_booking(booking)
+    elif op == "schedule":
+        master_schedules[record["m"]] = record["v"]
+        # Replay/restore starts with an empty cache; live edits invalidate per date
+        for date_str in record.get("d", ()):
+            availability_cache.pop((record["m"], parse_date(date_str)), None)
+    elif op == "wait":
+        index_waitlist_entry(record["e"])
+    elif op == "unwait":
+        unindex_waitlist_entry(record["id"])
+    elif op == "prompt":
+        pending_ratings[record["p"]["booking_id"]] = record["p"]
+    elif op == "unprompt":
+        for booking_id in record["ids"]:
+            pending_ratings.pop(booking_id, None)
+    elif op == "review":
+        review = record["r"]
+        pending_ratings.pop(review["booking_id"], None)
+        if review["booking_id"] not in reviews:
+            add_rating(review)
+        reviews[review["booking_id"]] = review
+    elif op == "client":
+        profile = get_client(record["c"]["user_id"])
+        if reindex:
+            unindex_client(profile)
+        profile.update(record["c"])
+        if reindex:
+            index_client(profile)
+    else:
+        logger.warning(f"Journal: unknown record type {op!r}")
+
+
+def index_waitlist_entry(entry: Dict):
+    """Add waitlist entry, its (master, date) index position and per-user index"""
+    waitlist[entry["id"]] = entry
+    key = (entry["master"] or "*", parse_date(entry["date"]))
+    waitlist_index.setdefault(key, []).append(entry["id"])
+    user_waitlist_index.setdefault(entry["user_id"], set()).add(entry["id"])
+
+
+def unindex_waitlist_entry(entry_id: int):
+    """Remove waitlist entry; touches only its own (master, date) bucket"""
+    entry = waitlist.pop(entry_id, None)
+    if entry is None:
+        return
+    key = (entry["master"] or "*", parse_date(entry["date"]))
+    bucket = waitlist_index.get(key)
+    if bucket is not None:
+        bucket.remove(entry_id)
+        if not bucket:
+            del waitlist_index[key]
+    user_entries = user_waitlist_index.get(entry["user_id"])
+    if user_entries is not None:
+        user_entries.discard(entry_id)
+        if not user_entries:
+            del user_waitlist_index[entry["user_id"]]
+
+
+def normalize_phone(phone: str) -> str:
+    """Digits-only phone in 7XXXXXXXXXX form (also used for prefixes)"""
+    digits = re.sub(r"\D", "", phone)
+    if digits.startswith("8"):
+        digits = "7" + digits[1:]
+    elif len(digits) == 10:
+        digits = "7" + digits
+    return digits
+
+
+def get_client(user_id: int) -> Dict:
+    """Client profile, created empty on first access"""
+    profile = client_data.get(user_id)
+    if profile is None:
+        profile = client_data[user_id] = {
+            "user_id": user_id, "first_name": None, "last_name": None, "phone": None
+        }
+    return profile
+
+
+def client_search_keys(profile: Dict) -> set:
+    """Prefix-search keys: lowercased name words and phone digits"""
+    name = " ".join(filter(None, (profile.get("first_name"), profile.get("last_name"))))
+    keys = set(name.lower().split())
+    if profile.get("phone"):
+        keys.add(profile["phone"])
+    return keys
+
+
+def index_client(profile: Dict):
+    """Add profile to phone and prefix-search indexes"""
+    user_id = profile["user_id"]
+    for key in client_search_keys(profile):
+        entry = (key, user_id)
+        position = bisect_left(client_search_index, entry)
+        if client_search_index[position:position + 1] != [entry]:
+            client_search_index.insert(position, entry)
+    if profile.get("phone"):
+        phone_index[profile["phone"]] = user_id
+
+
+def unindex_client(profile: Dict):
+    """Remove profile from phone and prefix-search indexes"""
+    user_id = profile["user_id"]
+    for key in client_search_keys(profile):
+        position = bisect_left(client_search_index, (key, user_id))
+        if client_search_index[position:position + 1] == [(key, user_id)]:
+            del client_search_index[position]
+    if phone_index.get(profile.get("phone")) == user_id:
+        del phone_index[profile["phone"]]
+
+
+def rebuild_client_index():
+    """Rebuild client lookup indexes from `client_data`"""
+    phone_index.clear()
+    client_search_index[:] = sorted(
+        (key, profile["user_id"])
+        for profile in client_data.values()
+        for key in client_search_keys(profile)
+    )
+    for profile in client_data.values():
+        if profile.get("phone"):
+            phone_index[profile["phone"]] = profile["user_id"]
+
+
+def search_clients(query: str, limit: int = 10) -> List[Dict]:
+    """Clients whose phone or any name word starts with `query`"""
+    query = query.strip()
+    if re.fullmatch(r"[\d\s()+-]+", query):
+        key = normalize_phone(query)
+        # Full number: direct hit
+        if key in phone_index:
+            return [client_data[phone_index[key]]]
+    else:
+        key = query.lower()
+    if not key:
+        return []
+    
+    found = []
+    position = bisect_left(client_search_index, (key,))
+    while position < len(client_search_index) and len(found) < limit:
+        prefix, user_id = client_search_index[position]
+        if not prefix.startswith(key):
+            break
+        if client_data[user_id] not in found:
+            found.append(client_data[user_id])
+        position += 1
+    return found
+
+
+def record_client(user_id: int, **fields):
+    """Journal and apply client profile changes (no-op if nothing changed)"""
+    profile = client_data.get(user_id)
+    if profile is not None and all(profile.get(k) == v for k, v in fields.items()):
+        return
+    apply_journal_record(journal.append("client", c={"user_id": user_id, **fields}))
+
+
+def set_last_booking(booking: Dict):
+    """Point client's "rebook" shortcut at their newest booking"""
+    profile = get_client(booking["user_id"])
+    last = profile.get("last_booking")
+    if last is None or last["created_at"] <= booking["created_at"]:
+        profile["last_booking"] = {
+            field: booking[field] for field in ("id", "service", "master", "created_at")
+        }
+
+
+def add_rating(review: Dict):
+    """Fold one review into its master's running sums.
+
+    Besides the plain sum/count, keeps an exponentially decayed sum and
+    weight (half-life `half_life_days`), so the decayed score is O(1) to
+    update and read. Decaying both by the same factor leaves their ratio
+    intact, so nothing needs to be re-decayed at read time.
+    """
+    half_life = CONFIG["ratings"]["half_life_days"] * 86400
+    at = datetime.fromisoformat(review["at"]).timestamp()
+    stats = master_ratings.setdefault(
+        review["master"], {"sum": 0, "count": 0, "decayed_sum": 0.0, "decayed_weight": 0.0, "at": at}
+    )
+    stats["sum"] += review["stars"]
+    stats["count"] += 1
+    if at >= stats["at"]:
+        factor = 0.5 ** ((at - stats["at"]) / half_life)
+        stats["decayed_sum"] = stats["decayed_sum"] * factor + review["stars"]
+        stats["decayed_weight"] = stats["decayed_weight"] * factor + 1
+        stats["at"] = at
+    else:
+        weight = 0.5 ** ((stats["at"] - at) / half_life)
+        stats["decayed_sum"] += review["stars"] * weight
+        stats["decayed_weight"] += weight
+
+
+def master_rating(master_name: str) -> Optional[tuple]:
+    """(time-decayed score, review count) or None if not rated yet"""
+    stats = master_ratings.get(master_name)
+    if not stats or not stats["count"]:
+        return None
+    return stats["decayed_sum"] / stats["decayed_weight"], stats["count"]
+
+
+def record_booking(booking: Dict):
+    """Journal and apply a new or updated booking"""
+    apply_journal_record(journal.append("book", b=booking_to_row(booking)))
+
+
+def is_slot_free(master_name: str, day: int, slot: int) -> bool:
+    """O(1) occupancy check against the slot index and waitlist holds"""
+    key = (master_name, day)
+    return slot not in slot_index.get(key, ()) and slot not in slot_holds.get(key, ())
+
+
+def create_booking(user_id: int, service: str, master_name: str, day: int, slot: int) -> Dict:
+    """Journal and store a new confirmed booking"""
+    now = clock.now()
+    # Journal seq keeps IDs unique within one second
+    booking_id = f"booking_{int(now.timestamp())}_{journal.seq + 1}"
+    booking = {
+        "id": booking_id,
+        "user_id": user_id,
+        "service": service,
+        "master": master_name,
+        "date": iso_date(day),
+        "time": SLOT_TIMES[slot],
+        "price": CONFIG["services"].get(service, 0),
+        "status": "confirmed",
+        "created_at": now.isoformat()
+    }
+    record_booking(booking)
+    return booking
+
+
+def cancel_booking(booking_id: str) -> Optional[Dict]:
+    """Cancel confirmed booking, freeing its slot. Returns updated booking"""
+    booking = bookings.get(booking_id)
+    if booking is None or booking["status"] != "confirmed":
+        return None
+    updated = dict(booking, status="cancelled")
+    record_booking(updated)
+    return updated
+
+
+def reschedule_booking(booking_id: str, day: int, slot: int) -> Optional[Dict]:
+    """Move confirmed booking to a free slot of the same master.
+
+    Freeing the old slot and claiming the new one is a single journal
+    record, so indexes and stats never observe a half-moved booking.
+    """
+    booking = bookings.get(booking_id)
+    if booking is None or booking["status"] != "confirmed":
+        return None
+    # A stale time screen may offer a slot that is now past, off-shift or on vacation
+    if slot not in UltraCalendar(booking["master"]).available_slots(day):
+        return None
+    updated = dict(booking, date=iso_date(day), time=SLOT_TIMES[slot])
+    record_booking(updated)
+    return updated
+
+
+def record_master_schedule(master_name: str, schedule: Dict, affected_dates=()):
+    """Journal and apply a master's schedule, invalidating `affected_dates`"""
+    apply_journal_record(
+        journal.append("schedule", m=master_name, v=schedule, d=sorted(affected_dates))
+    )
+
+
+def snapshot_state() -> Dict:
+    """Capture persistent state for a snapshot (cheap enough for the event loop)"""
+    # Bookings, schedules, entries and reviews are replaced on change, never
+    # mutated, so shallow copies are a consistent view; profiles are updated
+    # in place and ratings are running sums, so those are copied one level down
+    return {
+        "bookings": list(bookings.values()),
+        "master_schedules": dict(master_schedules),
+        "waitlist": list(waitlist.values()),
+        "clients": [dict(profile) for profile in client_data.values()],
+        "reviews": list(reviews.values()),
+        "pending_ratings": list(pending_ratings.values()),
+        "master_ratings": {master: dict(sums) for master, sums in master_ratings.items()},
+    }
+
+
+def snapshot_document(state: Dict) -> Dict:
+    """Snapshot file layout for captured state"""
+    rows = state["bookings"]
+    # Column-oriented: one list per field parses much faster than per-row lists
+    return dict(state, bookings={field: [b[field] for b in rows] for field in BOOKING_FIELDS})
+
+
+def save_snapshot():
+    """Write a snapshot synchronously (startup and shutdown, no updates in flight)"""
+    # submit_snapshot first waits for a background snapshot that outlived the loop
+    state = snapshot_state()
+    journal.submit_snapshot(lambda: snapshot_document(state)).result()
+
+
+async def save_snapshot_in_background() -> bool:
+    """Capture state on the loop, serialise and fsync it in the snapshot thread"""
+    if journal.snapshot_running:
+        return False
+    state = snapshot_state()
+    seq = journal.seq
+    await asyncio.wrap_future(journal.submit_snapshot(lambda: snapshot_document(state)))
+    logger.info(f"Snapshot written at journal seq {seq}")
+    return True
+
+
+def restore_state():
+    """Load latest snapshot, replay journal tail and rebuild indexes"""
+    started = perf_counter()
+    # Millions of small dicts: cyclic GC passes only slow the load down
+    gc.disable()
+    try:
+        _restore_state()
+    finally:
+        gc.enable()
+    journal.open()
+    logger.info(
+        f"State restored: {len(bookings)} live, {len(archive)} archived bookings "
+        f"in {perf_counter() - started:.2f}s"
+    )
+
+
+def _restore_state():
+    archive.load()
+    snapshot = journal.load_snapshot()
+    if snapshot is not None:
+        columns = snapshot.get("bookings", {})
+        if columns:
+            for row in zip(*(columns[field] for field in BOOKING_FIELDS)):
+                bookings[row[0]] = dict(zip(BOOKING_FIELDS, row))
+        master_schedules.update(snapshot.get("master_schedules", {}))
+        for entry in snapshot.get("waitlist", []):
+            index_waitlist_entry(entry)
+        for review in snapshot.get("reviews", []):
+            reviews[review["booking_id"]] = review
+        for prompt in snapshot.get("pending_ratings", []):
+            pending_ratings[prompt["booking_id"]] = prompt
+        master_ratings.update(snapshot.get("master_ratings", {}))
+        for profile in snapshot.get("clients", []):
+            client_data[profile["user_id"]] = profile
+        if "clients" not in snapshot:
+            # Snapshot predates client profiles: derive rebook pointers
+            for booking in bookings.values():
+                set_last_booking(booking)
+
+    for record in journal.read_tail(journal.seq):
+        apply_journal_record(record, reindex=False)
+
+    # Drop bookings that reached the archive before the last snapshot
+    if archive.cutoff:
+        for booking_id in [k for k, b in bookings.items() if b["date"] < archive.cutoff]:
+            del bookings[booking_id]
+
+    rebuild_indexes()
+    rebuild_client_index()
+
+
+async def snapshot_job(context: ContextTypes.DEFAULT_TYPE):
+    """Periodic snapshot (skipped when nothing changed)"""
+    if journal.records_since_snapshot == 0:
+        return
+    await save_snapshot_in_background()
+
+
+# ========================
+# BOOKING ARCHIVE
+# ========================
+
+_numpy = None
+
+
+def get_numpy():
+    """Import NumPy on first analytics use; None when it is not installed"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:  # Optional: archive analytics fall back to pure Python
+            _numpy = False
+    return _numpy or None
+
+
+class BookingArchive:
+    """Column-oriented store of past bookings
+
+    Each column is a typed `array` persisted as a raw binary file, so
+    loading millions of rows is a handful of reads. Rows are appended in
+    date order, which turns any date range into a contiguous slice found
+    by bisection. With NumPy installed, slices are zero-copy views and
+    aggregations are vectorized.
+    """
+
+    COLUMNS = {
+        "date": "i",      # date ordinal
+        "slot": "B",      # 30-minute slot within the day
+        "master": "H",    # index into dictionaries["master"]
+        "service": "H",   # index into dictionaries["service"]
+        "price": "i",
+        "status": "B",    # index into dictionaries["status"]
+        "user_id": "q",
+    }
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.columns = {name: array(code) for name, code in self.COLUMNS.items()}
+        self.dictionaries = {"master": [], "service": [], "status": []}
+        self._codes = {kind: {} for kind in self.dictionaries}
+        self.cutoff = None  # "YYYY-MM-DD": every booking before it is archived
+        # Lifetime confirmed [count, revenue] per master, kept in meta.json so
+        # startup does not have to scan (or import NumPy for) every column
+        self.master_totals = {}
+
+    def __len__(self) -> int:
+        return len(self.columns["date"])
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _encode(self, kind: str, value: str) -> int:
+        codes = self._codes[kind]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.dictionaries[kind])
+            self.dictionaries[kind].append(value)
+        return code
+
+    def load(self):
+        """Load columns written by previous runs"""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        self.cutoff = meta["cutoff"]
+        self.dictionaries = meta["dictionaries"]
+        self._codes = {
+            kind: {value: code for code, value in enumerate(values)}
+            for kind, values in self.dictionaries.items()
+        }
+        rows = meta["rows"]
+        for name, column in self.columns.items():
+            del column[:]
+            with open(self._column_path(name), "r+b") as f:
+                column.fromfile(f, rows)
+                # Drop the tail of an append interrupted before meta was written
+                f.truncate(rows * column.itemsize)
+        if "master_totals" in meta:
+            self.master_totals = meta["master_totals"]
+        else:  # Written before totals were stored
+            self.master_totals = {name: list(totals) for name, totals in self.group_totals("master").items()}
+
+    def append_bookings(self, past_bookings: List[Dict], cutoff: str):
+        """Append bookings dated before `cutoff` and persist"""
+        new = {name: array(code) for name, code in self.COLUMNS.items()}
+        for booking in sorted(past_bookings, key=lambda b: (b["date"], b["time"])):
+            new["date"].append(parse_date(booking["date"]))
+            new["slot"].append(parse_time(booking["time"]))
+            new["master"].append(self._encode("master", booking["master"]))
+            new["service"].append(self._encode("service", booking["service"]))
+            new["price"].append(booking["price"])
+            new["status"].append(self._encode("status", booking["status"]))
+            new["user_id"].append(booking["user_id"])
+            if booking["status"] == "confirmed":
+                totals = self.master_totals.setdefault(booking["master"], [0, 0])
+                totals[0] += 1
+                totals[1] += booking["price"]
+
+        os.makedirs(self.directory, exist_ok=True)
+        for name, column in new.items():
+            with open(self._column_path(name), "ab") as f:
+                column.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            self.columns[name].extend(column)
+        self.cutoff = cutoff
+
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"rows": len(self), "cutoff": cutoff, "dictionaries": self.dictionaries,
+                       "master_totals": self.master_totals}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+    def _range(self, start: Optional[int], end: Optional[int]) -> tuple:
+        """Row slice [lo, hi) for date ordinals within [start, end]"""
+        dates = self.columns["date"]
+        lo = bisect_left(dates, start) if start else 0
+        hi = bisect_right(dates, end) if end else len(dates)
+        return lo, hi
+
+    def iter_chunks(self, start: int = None, end: int = None, chunk_size: int = 10000):
+        """Yield decoded rows (date, time, master, service, price, status, user_id) in chunks"""
+        lo, hi = self._range(start, end)
+        masters = self.dictionaries["master"]
+        services = self.dictionaries["service"]
+        statuses = self.dictionaries["status"]
+        names = ("date", "slot", "master", "service", "price", "status", "user_id")
+        for chunk_lo in range(lo, hi, chunk_size):
+            chunk_hi = min(chunk_lo + chunk_size, hi)
+            rows = []
+            for ordinal, slot, master, service, price, status, user_id in zip(
+                *(self.columns[name][chunk_lo:chunk_hi] for name in names)
+            ):
+                rows.append((iso_date(ordinal), SLOT_TIMES[slot], masters[master], services[service],
+                             price, statuses[status], user_id))
+            yield rows
+
+    def user_rows(self, user_id: int, limit: int) -> List[tuple]:
+        """Latest `limit` decoded rows of one client, newest first"""
+        np = get_numpy()
+        if np is not None:
+            found = np.flatnonzero(self._view("user_id", 0, len(self)) == user_id)[::-1][:limit].tolist()
+        else:
+            found = []
+            user_ids = self.columns["user_id"]
+            for row in range(len(user_ids) - 1, -1, -1):
+                if user_ids[row] == user_id:
+                    found.append(row)
+                    if len(found) == limit:
+                        break
+        columns = self.columns
+        return [
+            (iso_date(columns["date"][row]), SLOT_TIMES[columns["slot"][row]],
+             self.dictionaries["master"][columns["master"][row]],
+             self.dictionaries["service"][columns["service"][row]],
+             columns["price"][row], self.dictionaries["status"][columns["status"][row]], user_id)
+            for row in found
+        ]
+
+    def _view(self, name: str, lo: int, hi: int):
+        column = self.columns[name]
+        np = get_numpy()
+        if np is not None:
+            return np.frombuffer(column, dtype=column.typecode)[lo:hi]
+        return column[lo:hi]
+
+    def group_totals(self, key: str, start: int = None, end: int = None) -> Dict:
+        """Confirmed bookings count and revenue grouped by master or service"""
+        lo, hi = self._range(start, end)
+        confirmed = self._codes["status"].get("confirmed")
+        names = self.dictionaries[key]
+        if confirmed is None or lo >= hi:
+            return {}
+
+        np = get_numpy()
+        if np is not None:
+            mask = self._view("status", lo, hi) == confirmed
+            codes = self._view(key, lo, hi)[mask]
+            counts = np.bincount(codes, minlength=len(names))
+            revenue = np.bincount(codes, weights=self._view("price", lo, hi)[mask],
+                                  minlength=len(names))
+            return {
+                names[code]: (int(counts[code]), int(revenue[code]))
+                for code in np.flatnonzero(counts)
+            }
+
+        counts = [0] * len(names)
+        revenue = [0] * len(names)
+        for code, price, status in zip(self._view(key, lo, hi), self._view("price", lo, hi),
+                                       self._view("status", lo, hi)):
+            if status == confirmed:
+                counts[code] += 1
+                revenue[code] += price
+        return {names[code]: (counts[code], revenue[code])
+                for code in range(len(names)) if counts[code]}
+
+    def heatmap(self, start: int = None, end: int = None) -> List[List[int]]:
+        """Confirmed bookings per weekday (rows) and slot (columns)"""
+        lo, hi = self._range(start, end)
+        confirmed = self._codes["status"].get("confirmed")
+        grid = [[0] * SLOTS_PER_DAY for _ in range(7)]
+        if confirmed is None or lo >= hi:
+            return grid
+
+        np = get_numpy()
+        if np is not None:
+            mask = self._view("status", lo, hi) == confirmed
+            # date.fromordinal(1) is a Monday, so weekday = (ordinal - 1) % 7
+            weekdays = (self._view("date", lo, hi)[mask].astype(np.int64) - 1) % 7
+            cells = weekdays * SLOTS_PER_DAY + self._view("slot", lo, hi)[mask]
+            counts = np.bincount(cells, minlength=7 * SLOTS_PER_DAY)
+            return counts.reshape(7, SLOTS_PER_DAY).tolist()
+
+        for ordinal, slot, status in zip(self._view("date", lo, hi), self._view("slot", lo, hi),
+                                         self._view("status", lo, hi)):
+            if status == confirmed:
+                grid[(ordinal - 1) % 7][slot] += 1
+        return grid
+
+
+archive = BookingArchive(os.path.join(CONFIG["storage"]["dir"], "archive"))
+
+
+def archive_past_bookings(today: int = None) -> int:
+    """Move bookings dated before today from the live store to the archive"""
+    cutoff = iso_date(today or clock.today())
+    past = [b for b in bookings.values() if b["date"] < cutoff]
+    if not past:
+        return 0
+    archive.append_bookings(past, cutoff)
+    for booking in past:
+        del bookings[booking["id"]]
+    rebuild_indexes()
+    logger.info(f"Archived {len(past)} bookings before {cutoff}")
+    return len(past)
+
+
+async def archive_job(context: ContextTypes.DEFAULT_TYPE):
+    """Daily archiving of past bookings and expired waitlist entries"""
+    # Archived visits can no longer be prompted for a rating
+    await RatingSystem.prompt_job(context)
+    if archive_past_bookings():
+        # Archived bookings no longer need their journal records
+        await save_snapshot_in_background()
+    today = clock.today()
+    today_str = iso_date(today)
+    for entry_id in [e["id"] for e in waitlist.values() if e["date"] < today_str]:
+        apply_journal_record(journal.append("unwait", id=entry_id))
+    for key in [k for k in availability_cache if k[1] < today]:
+        del availability_cache[key]
+    expired_before = iso_date(today - CONFIG["ratings"]["answer_days"])
+    expired = [p["booking_id"] for p in pending_ratings.values() if p["date"] < expired_before]
+    if expired:
+        apply_journal_record(journal.append("unprompt", ids=expired))
+
+
+def range_analytics(start: int, end: int) -> Dict:
+    """Totals per master and per service for archived + live bookings"""
+    result = {"bookings": 0, "revenue": 0, "master": {}, "service": {}}
+    for key in ("master", "service"):
+        for name, (count, revenue) in archive.group_totals(key, start, end).items():
+            result[key][name] = [count, revenue]
+            if key == "master":
+                result["bookings"] += count
+                result["revenue"] += revenue
+
+    # Live store holds only today and upcoming bookings - small enough to scan
+    start_str, end_str = iso_date(start), iso_date(end)
+    for booking in bookings.values():
+        if booking["status"] != "confirmed" or not start_str <= booking["date"] <= end_str:
+            continue
+        result["bookings"] += 1
+        result["revenue"] += booking["price"]
+        for key in ("master", "service"):
+            totals = result[key].setdefault(booking[key], [0, 0])
+            totals[0] += 1
+            totals[1] += booking["price"]
+    return result
+
+
+def range_heatmap(start: int, end: int) -> List[List[int]]:
+    """Weekday x slot heatmap for archived + live bookings"""
+    grid = archive.heatmap(start, end)
+    start_str, end_str = iso_date(start), iso_date(end)
+    for booking in bookings.values():
+        if booking["status"] != "confirmed" or not start_str <= booking["date"] <= end_str:
+            continue
+        weekday = (parse_date(booking["date"]) - 1) % 7
+        grid[weekday][parse_time(booking["time"])] += 1
+    return grid
+
+
+# ========================
+# MASTER SCHEDULES
+# ========================
+
+# master_schedules[master] = {
+#     "vacations": [{"start": "YYYY-MM-DD", "end": "YYYY-MM-DD"}, ...],  # sorted, disjoint
+#     "days": {"YYYY-MM-DD": {"shift": ["HH:MM", "HH:MM"], "breaks": [["HH:MM", "HH:MM"], ...]}}
+# }
+
+
+def add_date_interval(intervals: List[Dict], start: date, end: date) -> List[Dict]:
+    """Insert [start, end] into a sorted disjoint interval list, merging neighbours"""
+    lo, hi = start.toordinal(), end.toordinal()
+    result = []
+    for interval in intervals:
+        a = date.fromisoformat(interval["start"]).toordinal()
+        b = date.fromisoformat(interval["end"]).toordinal()
+        if b + 1 < lo or a > hi + 1:
+            result.append(interval)
+        else:
+            lo, hi = min(lo, a), max(hi, b)
+    result.append({"start": date.fromordinal(lo).isoformat(), "end": date.fromordinal(hi).isoformat()})
+    result.sort(key=lambda interval: interval["start"])
+    return result
+
+
+def remove_date_interval(intervals: List[Dict], start: date, end: date) -> List[Dict]:
+    """Cut [start, end] out of a sorted disjoint interval list"""
+    lo, hi = start.toordinal(), end.toordinal()
+    result = []
+    for interval in intervals:
+        a = date.fromisoformat(interval["start"]).toordinal()
+        b = date.fromisoformat(interval["end"]).toordinal()
+        if b < lo or a > hi:
+            result.append(interval)
+            continue
+        if a < lo:
+            result.append({"start": interval["start"], "end": date.fromordinal(lo - 1).isoformat()})
+        if b > hi:
+            result.append({"start": date.fromordinal(hi + 1).isoformat(), "end": interval["end"]})
+    return result
+
+
+def dates_to_intervals(dates: List[date]) -> List[tuple]:
+    """Collapse dates into runs of consecutive days"""
+    runs = []
+    for day in sorted(set(dates)):
+        if runs and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
+
+
+def _time_to_minutes(time_str: str) -> int:
+    hours, minutes = time_str.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _minutes_to_time(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _compute_working_slots(master_name: str, day: int) -> tuple:
+    date_str = iso_date(day)
+    working_hours = CONFIG["salon_info"]["working_hours"]
+    schedule = master_schedules.get(master_name, {})
+    
+    for vacation in schedule.get("vacations", []):
+        if vacation["start"] <= date_str <= vacation["end"]:
+            return ()
+    
+    override = schedule.get("days", {}).get(date_str)
+    if override is not None:
+        shift = override["shift"]
+        breaks = override.get("breaks", [])
+    elif (day - 1) % 7 + 1 in working_hours.get("closed_days", []):  # ISO weekday
+        return ()
+    else:
+        shift = [working_hours["start"], working_hours["end"]]
+        breaks = [working_hours["lunch"]]
+    
+    start = _time_to_minutes(shift[0])
+    # Shifts journaled before times were validated may run past midnight
+    end = min(_time_to_minutes(shift[1]), SLOTS_PER_DAY * SLOT_MINUTES)
+    break_minutes = [(_time_to_minutes(a), _time_to_minutes(b)) for a, b in breaks]
+    return tuple(
+        minute // SLOT_MINUTES
+        for minute in range(start - start % SLOT_MINUTES, end, SLOT_MINUTES)
+        if minute >= start and minute + SLOT_MINUTES <= end
+        and not any(a < minute + SLOT_MINUTES and minute < b for a, b in break_minutes)
+    )
+
+
+def working_slots(master_name: str, day: int) -> tuple:
+    """Master's working slots for a date (cached until that date's schedule changes)"""
+    key = (master_name, day)
+    slots = availability_cache.get(key)
+    if slots is None:
+        slots = availability_cache[key] = _compute_working_slots(master_name, day)
+    return slots
+
+
 # ========================
 # ULTRACALENDAR CLASS
 # ========================
@@ -91,20 +1317,13 @@ class UltraCalendar:
     
     def __init__(self, master_name: str):
         self.master_name = master_name
-        self.lunch_break = (13, 14)  # 13:00-14:00
-        self.tz = pytz.timezone('Europe/Moscow')
         
-    def create_visual_calendar(self, date_str: str = None, offset_days: int = 0) -> str:
-        """Create visual calendar grid (14 days in 2 rows of 7)"""
-        if date_str is None:
-            date = datetime.now(self.tz).date()
-        else:
-            date = datetime.strptime(date_str, "%Y-%m-%d").date()
-        
-        # Add offset
-        date = date + timedelta(days=offset_days)
+    def create_visual_calendar(self, day: int = None, offset_days: int = 0) -> str:
+        """Create visual month grid around date ordinal `day` (default: today)"""
+        today = clock.today()
+        month_day = date.fromordinal((day or today) + offset_days)
         
-        calendar_text = f"📅 *{date.strftime('%B %Y')}*\n"
+        calendar_text = f"📅 *{month_day.strftime('%B %Y')}*\n"
         calendar_text += "─" * 35 + "\n"
         
         # Days of week header
@@ -113,34 +1332,33 @@ class UltraCalendar:
         calendar_text += "─" * 35 + "\n"
         
         # Calculate first day of month
-        first_day_of_month = date.replace(day=1)
-        start_weekday = first_day_of_month.weekday()  # 0=Monday
+        first_of_month = month_day.replace(day=1).toordinal()
+        start_weekday = (first_of_month - 1) % 7  # 0=Monday
         
         # Days in month
-        days_in_month = cal_module.monthrange(date.year, date.month)[1]
+        days_in_month = calendar.monthrange(month_day.year, month_day.month)[1]
         
         # Build calendar grid
-        day = 1
+        day_of_month = 1
         for week in range(6):
             week_str = ""
             for weekday in range(7):
                 cell_pos = week * 7 + weekday
                 
-                if cell_pos < start_weekday or day > days_in_month:
+                if cell_pos < start_weekday or day_of_month > days_in_month:
                     week_str += "    "  # Empty cell
                 else:
-                    current_date_obj = date.replace(day=day)
-                    is_available = self.is_date_available(current_date_obj.strftime("%Y-%m-%d"))
+                    current = first_of_month + day_of_month - 1
                     
-                    if current_date_obj == datetime.now(self.tz).date():
+                    if current == today:
                         emoji = "🔵"  # Today
-                    elif is_available:
+                    elif self.is_day_available(current):
                         emoji = "🟢"  # Available
                     else:
                         emoji = "🔴"  # Not available
                     
-                    week_str += f"{emoji}{day:2d} "
-                    day += 1
+                    week_str += f"{emoji}{day_of_month:2d} "
+                    day_of_month += 1
             
             calendar_text += week_str.rstrip() + "\n"
         
@@ -149,85 +1367,49 @@ class UltraCalendar:
         
         return calendar_text
     
-    def create_time_grid(self, date_str: str) -> tuple:
-        """Create time slots in grid format (3 columns, 5 rows)"""
-        available_times = self.generate_available_times(date_str)
+    def create_time_grid(self, day: int) -> tuple:
+        """Create time slots in grid format (3 columns); returns (slots, text)"""
+        available_slots = self.available_slots(day)
         
-        if not available_times:
+        if not available_slots:
             return None, "❌ На эту дату нет свободных слотов"
         
         # Create grid text
-        time_text = f"⏰ *Доступные времена на {date_str}*\n"
+        time_text = f"⏰ *Доступные времена на {format_date(day)}*\n"
         time_text += "─" * 25 + "\n"
         
         # Format times in grid (3 columns)
-        for i in range(0, len(available_times), 3):
-            row = available_times[i:i+3]
-            row_text = "  ".join([f"{t:>5}" for t in row])
+        for i in range(0, len(available_slots), 3):
+            row = available_slots[i:i+3]
+            row_text = "  ".join([f"{SLOT_TIMES[slot]:>5}" for slot in row])
             time_text += row_text + "\n"
         
         time_text += "─" * 25
         
-        return available_times, time_text
+        return available_slots, time_text
     
-    def is_date_available(self, date_str: str) -> bool:
-        """Check if date is available for booking"""
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        
-        # Check if weekend
-        if date_obj.weekday() >= 5:
-            return False
-        
+    def is_day_available(self, day: int) -> bool:
+        """Check if date ordinal is open for booking"""
         # Check if date is in past
-        if date_obj.date() < datetime.now(self.tz).date():
+        if day < clock.today():
             return False
         
-        # Check if master has vacation
-        if self.master_name in master_schedules:
-            vacations = master_schedules[self.master_name].get("vacations", [])
-            for vacation in vacations:
-                v_start = datetime.strptime(vacation["start"], "%Y-%m-%d").date()
-                v_end = datetime.strptime(vacation["end"], "%Y-%m-%d").date()
-                if v_start <= date_obj.date() <= v_end:
-                    return False
-        
-        return True
+        # Closed days, vacations and custom shifts
+        return bool(working_slots(self.master_name, day))
     
-    def generate_available_times(self, date_str: str) -> List[str]:
-        """Generate available time slots for date"""
-        if not self.is_date_available(date_str):
+    def available_slots(self, day: int) -> List[int]:
+        """Free slot indices for date ordinal"""
+        if not self.is_day_available(day):
             return []
         
-        times = []
-        working_hours = CONFIG["salon_info"]["working_hours"]
-        lunch = CONFIG["salon_info"]["working_hours"]["lunch"]
-        
-        start_hour = int(working_hours["start"].split(":")[0])
-        end_hour = int(working_hours["end"].split(":")[0])
-        lunch_start = int(lunch[0].split(":")[0])
-        lunch_end = int(lunch[1].split(":")[0])
-        
-        for hour in range(start_hour, end_hour):
-            for minute in ["00", "30"]:
-                # Skip lunch break
-                if lunch_start <= hour < lunch_end:
-                    continue
-                
-                time_str = f"{hour:02d}:{minute}"
-                
-                # Check if slot is booked
-                is_booked = any(
-                    b["master"] == self.master_name and
-                    b["date"] == date_str and
-                    b["time"] == time_str and
-                    b["status"] == "confirmed"
-                    for b in bookings.values()
-                )
-                
-                if not is_booked:
-                    times.append(time_str)
-        
-        return times
+        booked = slot_index.get((self.master_name, day), {})
+        held = slot_holds.get((self.master_name, day), {})
+        # Slots earlier today are gone
+        first_slot = clock.current_slot() + 1 if day == clock.today() else 0
+        return [
+            slot for slot in working_slots(self.master_name, day)
+            if slot >= first_slot and slot not in booked and slot not in held
+        ]
 
 
 # ========================
@@ -239,13 +1421,8 @@ async def show_role_selection(update: Update, context: ContextTypes.DEFAULT_TYPE
     user = update.effective_user
     user_id = user.id
     
-    # Initialize client data
-    if user_id not in client_data:
-        client_data[user_id] = {
-            "user_id": user_id,
-            "first_name": user.first_name,
-            "phone": None
-        }
+    # Create or refresh client profile
+    record_client(user_id, first_name=user.first_name, last_name=user.last_name)
     
     keyboard = [
         [InlineKeyboardButton("👤 Клиент (записаться)", callback_data="role_client")],
@@ -299,6 +1476,9 @@ async def handle_role_selection(update: Update, context: ContextTypes.DEFAULT_TY
 async def show_client_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show client menu"""
     query = update.callback_query
+    profile = client_data.get(query.from_user.id, {})
+    # Leaving to the menu abandons any unfinished booking flow
+    user_sessions[query.from_user.id] = {}
     
     keyboard = [
         [InlineKeyboardButton("📅 Записаться", callback_data="start_booking")],
@@ -306,6 +1486,13 @@ async def show_client_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("🌐 Веб-приложение", callback_data="open_webapp")],
         [InlineKeyboardButton("⬅️ Изменить роль", callback_data="show_roles")],
     ]
+    last = profile.get("last_booking")
+    if last:
+        keyboard.insert(1, [InlineKeyboardButton(
+            f"🔁 Повторить: {last['service']} у {last['master']}", callback_data="rebook"
+        )])
+    if not profile.get("phone"):
+        keyboard.insert(-1, [InlineKeyboardButton("📱 Указать телефон", callback_data="share_phone")])
     
     await query.edit_message_text(
         "👤 *КЛИЕНТСКОЕ МЕНЮ*\n\n"
@@ -383,8 +1570,10 @@ async def handle_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = []
     for master_name, master_info in CONFIG["masters"].items():
         spec = ", ".join(master_info["specialization"])
+        rating = master_rating(master_name)
+        stars = f"⭐ {rating[0]:.1f} ({rating[1]})" if rating else "🆕"
         keyboard.append([InlineKeyboardButton(
-            f"👨‍💼 {master_name}\n   {spec}",
+            f"👨‍💼 {master_name} {stars}\n   {spec}",
             callback_data=f"master_{master_name}"
         )])
     
@@ -409,26 +1598,28 @@ async def handle_master(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_sessions[user_id]["master"] = master
     
+    await show_date_selection(query, master)
+
+
+async def show_date_selection(query, master: str, header: str = ""):
+    """Render calendar and date buttons for master"""
     # Show calendar with date buttons
     calendar = UltraCalendar(master)
     calendar_text = calendar.create_visual_calendar()
     
     # Generate date buttons (2 columns, next 14 days)
     keyboard = []
+    today = clock.today()
     for i in range(14):
-        current_date = datetime.now() + timedelta(days=i)
-        date_formatted = current_date.strftime("%Y-%m-%d")
-        day_name = current_date.strftime("%a")
-        
-        is_available = calendar.is_date_available(date_formatted)
+        day = today + i
         
-        if is_available:
-            button_text = f"{day_name} {current_date.strftime('%d.%m')}"
+        if calendar.is_day_available(day):
+            button_text = format_date(day, "%a %d.%m")
             if i == 0:
                 button_text += " (сегодня)"
             keyboard.append(InlineKeyboardButton(
                 f"🟢 {button_text}",
-                callback_data=f"date_{date_formatted}"
+                callback_data=f"date_{day}"
             ))
     
     # Arrange in rows of 2
@@ -437,7 +1628,7 @@ async def handle_master(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard_rows.append([InlineKeyboardButton("☰ Меню", callback_data="back_to_client")])
     
     await query.edit_message_text(
-        calendar_text + f"\n👨‍💼 *Мастер: {master}*\n\n*Выберите дату:*",
+        header + calendar_text + f"\n👨‍💼 *Мастер: {master}*\n\n*Выберите дату:*",
         reply_markup=InlineKeyboardMarkup(keyboard_rows),
         parse_mode=ParseMode.MARKDOWN
     )
@@ -448,18 +1639,21 @@ async def handle_calendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    user_id = query.from_user.id
-    date_str = query.data.replace("date_", "")
-    
-    user_sessions[user_id]["date"] = date_str
+    await show_time_selection(query, query.from_user.id, int(query.data.replace("date_", "")))
+
+
+async def show_time_selection(query, user_id: int, day: int, header: str = ""):
+    """Render free time slots of the session's master for date ordinal"""
+    user_sessions[user_id]["date"] = day
     
     # Show available times
     master = user_sessions[user_id]["master"]
     calendar = UltraCalendar(master)
-    available_times, time_text = calendar.create_time_grid(date_str)
+    available_times, time_text = calendar.create_time_grid(day)
     
     if available_times is None:
         keyboard = [
+            [InlineKeyboardButton("🕒 Встать в лист ожидания", callback_data="wl_join")],
             [InlineKeyboardButton("⬅️ Назад", callback_data="start_booking")],
             [InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]
         ]
@@ -472,20 +1666,22 @@ async def handle_calendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Create time buttons (3 columns)
     keyboard = []
-    for time_slot in available_times:
+    for slot in available_times:
         keyboard.append(InlineKeyboardButton(
-            f"🕐 {time_slot}",
-            callback_data=f"time_{time_slot}"
+            f"🕐 {SLOT_TIMES[slot]}",
+            callback_data=f"time_{slot}"
         ))
     
     # Arrange in rows of 3
     time_rows = [keyboard[i:i+3] for i in range(0, len(keyboard), 3)]
+    time_rows.append([InlineKeyboardButton("📅 Другая дата", callback_data=f"master_{master}")])
     time_rows.append([InlineKeyboardButton("⬅️ Назад", callback_data="start_booking")])
     time_rows.append([InlineKeyboardButton("☰ Меню", callback_data="back_to_client")])
     
-    date_formatted = datetime.strptime(date_str, "%Y-%m-%d").strftime("%d.%m.%Y (%a)")
+    date_formatted = format_date(day, "%d.%m.%Y (%a)")
     
     await query.edit_message_text(
+        header +
         f"⏰ *Выберите время на {date_formatted}*\n\n"
         f"👨‍💼 *Мастер:* {master}\n"
         f"✂️ *Услуга:* {user_sessions[user_id]['service']}\n\n"
@@ -501,29 +1697,26 @@ async def handle_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = query.from_user.id
-    time_str = query.data.replace("time_", "")
-    
-    user_sessions[user_id]["time"] = time_str
+    user_sessions[user_id]["time"] = int(query.data.replace("time_", ""))
     
     # Show confirmation
     session = user_sessions[user_id]
     service = session["service"]
     master = session["master"]
-    date = session["date"]
-    time = session["time"]
+    time = SLOT_TIMES[session["time"]]
     price = CONFIG["services"].get(service, 0)
     
-    date_obj = datetime.strptime(date, "%Y-%m-%d")
-    date_formatted = date_obj.strftime("%d.%m.%Y (%A)")
+    date_formatted = format_date(session["date"], "%d.%m.%Y (%A)")
     
+    title = "🔁 *Перенос записи:*" if session.get("reschedule") else "📋 *Проверьте ваши данные:*"
     confirmation_text = (
-        f"📋 *Проверьте ваши данные:*\n\n"
+        f"{title}\n\n"
         f"✂️ *Услуга:*\n   {service}\n\n"
         f"👨‍💼 *Мастер:*\n   {master}\n\n"
         f"📅 *Дата:*\n   {date_formatted}\n\n"
         f"⏰ *Время:*\n   {time}\n\n"
         f"💰 *Стоимость:*\n   {price}₽\n\n"
-        f"Подтвердить запись?"
+        f"{'Перенести запись на это время?' if session.get('reschedule') else 'Подтвердить запись?'}"
     )
     
     keyboard = [
@@ -563,38 +1756,48 @@ async def handle_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return
     
-    session = user_sessions[user_id]
+    session = user_sessions.get(user_id, {})
     
-    # Create booking
-    booking_id = f"booking_{int(datetime.now().timestamp())}"
-    booking = {
-        "id": booking_id,
-        "user_id": user_id,
-        "service": session["service"],
-        "master": session["master"],
-        "date": session["date"],
-        "time": session["time"],
-        "price": CONFIG["services"].get(session["service"], 0),
-        "status": "confirmed",
-        "created_at": datetime.now().isoformat()
-    }
+    # A repeated tap arrives after the first one already used up the session
+    if not {"service", "master", "date", "time"} <= session.keys():
+        await query.edit_message_text(
+            "❌ *Сессия устарела, начните запись заново*",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")]]),
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
     
-    bookings[booking_id] = booking
+    if session.get("reschedule"):
+        await BookingLifecycleSystem.complete_reschedule(query, context, session)
+        return
     
-    # Update stats
-    if session["master"] not in master_stats:
-        master_stats[session["master"]] = {"bookings": 0, "revenue": 0}
+    # The slot may have been taken, or the schedule changed, while this client was deciding
+    if session["time"] not in UltraCalendar(session["master"]).available_slots(session["date"]):
+        keyboard = [
+            [InlineKeyboardButton("🕐 Выбрать другое время", callback_data=f"date_{session['date']}")],
+            [InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]
+        ]
+        await query.edit_message_text(
+            "⚠️ *Это время уже недоступно.* Пожалуйста, выберите другое.",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return
     
-    master_stats[session["master"]]["bookings"] += 1
-    master_stats[session["master"]]["revenue"] += booking["price"]
+    # Journal, store and update stats/indexes
+    booking = create_booking(
+        user_id, session["service"], session["master"], session["date"], session["time"]
+    )
+    booking_id = booking["id"]
+    session_date = session["date"]
     
     # Clear session
     user_sessions[user_id] = {}
     
-    # Notify admin
+    # Notify admin and master
+    NotificationSystem.queue(context, "new", booking)
     try:
-        app = Application.builder().token(CONFIG["token"]).build()
-        await app.bot.send_message(
+        await context.bot.send_message(
             chat_id=CONFIG["admin_id"],
             text=(
                 f"✅ *Новая запись!*\n\n"
@@ -603,7 +1806,7 @@ async def handle_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE
                 f"📅 Дата: {booking['date']}\n"
                 f"⏰ Время: {booking['time']}\n"
                 f"💰 Цена: {booking['price']}₽\n"
-                f"👤 Клиент ID: {booking['user_id']}"
+                f"👤 Клиент: {escape_markdown(ClientSystem.label(client_data.get(user_id, {'user_id': user_id})))}"
             ),
             parse_mode=ParseMode.MARKDOWN
         )
@@ -615,15 +1818,15 @@ async def handle_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE
         [InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")],
         [InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]
     ]
-    
-    date_obj = datetime.strptime(booking["date"], "%Y-%m-%d")
+    if not client_data.get(user_id, {}).get("phone"):
+        keyboard.insert(0, [InlineKeyboardButton("📱 Оставить телефон для связи", callback_data="share_phone")])
     
     await query.edit_message_text(
         f"✅ *Запись успешно создана!*\n\n"
         f"ID: `{booking_id}`\n"
         f"✂️ {booking['service']}\n"
         f"👨‍💼 {booking['master']}\n"
-        f"📅 {date_obj.strftime('%d.%m.%Y (%A)')}\n"
+        f"📅 {format_date(session_date, '%d.%m.%Y (%A)')}\n"
         f"⏰ {booking['time']}\n"
         f"💰 {booking['price']}₽\n\n"
         f"Спасибо за выбор *{CONFIG['salon_name']}*!",
@@ -640,11 +1843,13 @@ async def my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = query.from_user.id
     
     user_bookings = [
-        b for b in bookings.values()
-        if b["user_id"] == user_id and b["status"] == "confirmed"
+        bookings[booking_id] for booking_id in user_bookings_index.get(user_id, ())
+        if bookings[booking_id]["status"] == "confirmed"
     ]
+    user_bookings.sort(key=lambda b: (b["date"], b["time"]))
+    user_waits = WaitlistSystem.user_entries(user_id)
     
-    if not user_bookings:
+    if not user_bookings and not user_waits:
         keyboard = [
             [InlineKeyboardButton("📅 Записаться", callback_data="start_booking")],
             [InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]
@@ -656,22 +1861,35 @@ async def my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
-    text = "📋 *МОИ ЗАПИСИ:*\n\n"
+    text = "📋 *МОИ ЗАПИСИ:*\n\n" if user_bookings else ""
     for i, booking in enumerate(user_bookings[:10], 1):
-        date_obj = datetime.strptime(booking['date'], "%Y-%m-%d")
         text += (
             f"{i}. ✂️ {booking['service']}\n"
             f"   👨‍💼 Мастер: {booking['master']}\n"
-            f"   📅 {date_obj.strftime('%d.%m.%Y')}\n"
+            f"   📅 {format_date(parse_date(booking['date']))}\n"
             f"   ⏰ {booking['time']}\n"
             f"   💰 {booking['price']}₽\n"
             f"   ID: `{booking['id']}`\n\n"
         )
     
-    keyboard = [
-        [InlineKeyboardButton("📅 Записаться ещё", callback_data="start_booking")],
-        [InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]
-    ]
+    keyboard = []
+    today_str = iso_date(clock.today())
+    for i, booking in enumerate(user_bookings[:10], 1):
+        if booking["date"] >= today_str:
+            keyboard.append([
+                InlineKeyboardButton(f"🔁 Перенести {i}", callback_data=f"move_booking_{booking['id']}"),
+                InlineKeyboardButton(f"❌ Отменить {i}", callback_data=f"cancel_booking_{booking['id']}")
+            ])
+    if user_waits:
+        text += "🕒 *ЛИСТ ОЖИДАНИЯ:*\n\n"
+        for entry in user_waits:
+            text += f"• {entry['date']} {WaitlistSystem.describe(entry)}\n"
+            keyboard.append([InlineKeyboardButton(
+                f"🚪 Покинуть ожидание {entry['date']}",
+                callback_data=f"wl_leave_{entry['id']}"
+            )])
+    keyboard.append([InlineKeyboardButton("📅 Записаться ещё", callback_data="start_booking")])
+    keyboard.append([InlineKeyboardButton("☰ Меню", callback_data="back_to_client")])
     
     await query.edit_message_text(
         text, 
@@ -680,6 +1898,839 @@ async def my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+# ========================
+# NOTIFICATIONS
+# ========================
+
+class NotificationSystem:
+    """Coalesced booking notifications and daily agenda for masters"""
+    
+    ICONS = {"new": "✅", "cancel": "❌", "move": "🔁"}
+    
+    @staticmethod
+    def queue(context: ContextTypes.DEFAULT_TYPE, kind: str, booking: Dict, old: tuple = None):
+        """Record a new/cancel/move of booking and (re)arm the master's flush job"""
+        master_name = booking["master"]
+        if master_name not in CONFIG["masters"]:
+            return
+        now = clock.now()
+        pending = pending_notifications.setdefault(master_name, {"first": now, "events": {}})
+        events = pending["events"]
+        day, slot = parse_date(booking["date"]), parse_time(booking["time"])
+        
+        # Fold repeated changes of one booking into its net effect
+        event = events.get(booking["id"])
+        if event is None:
+            events[booking["id"]] = {
+                "kind": kind, "service": booking["service"], "date": day, "time": slot, "old": old
+            }
+        elif kind == "cancel":
+            if event["kind"] == "new":
+                del events[booking["id"]]
+            else:
+                event["kind"] = "cancel"
+                if event["old"]:
+                    event["date"], event["time"] = event["old"]
+        elif kind == "move":
+            event["date"], event["time"] = day, slot
+            if event["kind"] == "move" and event["old"] == (day, slot):
+                del events[booking["id"]]
+        
+        # Debounce: wait for a quiet period, but never past the max delay
+        settings = CONFIG["notifications"]
+        waited = (now - pending["first"]).total_seconds()
+        delay = max(0, min(settings["coalesce_seconds"], settings["coalesce_max_seconds"] - waited))
+        name = f"notify_{master_name}"
+        for job in context.job_queue.get_jobs_by_name(name):
+            job.schedule_removal()
+        context.job_queue.run_once(NotificationSystem.flush, when=delay, data=master_name, name=name)
+    
+    @staticmethod
+    def render_changes(events: Dict) -> str:
+        """One message for all pending changes, in date/time order"""
+        text = "🔔 *Изменения в записи*\n\n"
+        for event in sorted(events.values(), key=lambda e: (e["date"], e["time"])):
+            when = f"{format_date(event['date'], '%d.%m')} {SLOT_TIMES[event['time']]}"
+            if event["kind"] == "move":
+                old_day, old_slot = event["old"]
+                when = f"{format_date(old_day, '%d.%m')} {SLOT_TIMES[old_slot]} → {when}"
+            text += f"{NotificationSystem.ICONS[event['kind']]} {when} — {event['service']}\n"
+        return text
+    
+    @staticmethod
+    async def flush(context: ContextTypes.DEFAULT_TYPE):
+        """Send master's coalesced changes"""
+        master_name = context.job.data
+        pending = pending_notifications.pop(master_name, None)
+        if not pending or not pending["events"]:
+            return
+        try:
+            await context.bot.send_message(
+                chat_id=CONFIG["masters"][master_name]["telegram_id"],
+                text=NotificationSystem.render_changes(pending["events"]),
+                parse_mode=ParseMode.MARKDOWN
+            )
+        except Exception as e:
+            logger.error(f"Error notifying master {master_name}: {e}")
+    
+    @staticmethod
+    def render_digest(master_name: str, day: int) -> Optional[str]:
+        """Agenda for one master and day from the slot index; None if nothing booked"""
+        day_slots = slot_index.get((master_name, day))
+        if not day_slots:
+            return None
+        text = (
+            f"☀️ *Доброе утро, {master_name}!*\n\n"
+            f"📅 *{format_date(day, '%d.%m (%a)')}:* {len(day_slots)} запис(и)\n\n"
+        )
+        for slot, booking_id in sorted(day_slots.items()):
+            booking = bookings[booking_id]
+            text += f"  • {SLOT_TIMES[slot]} - {booking['service']} ({booking['price']}₽)\n"
+        return text
+    
+    @staticmethod
+    async def send_batched(bot, messages: List[tuple]):
+        """Send (chat_id, text, reply_markup) messages concurrently in rate-limited batches"""
+        batch_size = CONFIG["notifications"]["send_batch"]
+        for i in range(0, len(messages), batch_size):
+            if i:
+                await asyncio.sleep(1)
+            batch = messages[i:i + batch_size]
+            results = await asyncio.gather(
+                *(bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup,
+                                   parse_mode=ParseMode.MARKDOWN)
+                  for chat_id, text, reply_markup in batch),
+                return_exceptions=True
+            )
+            for (chat_id, _, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error sending to {chat_id}: {result}")
+    
+    @staticmethod
+    async def digest_job(context: ContextTypes.DEFAULT_TYPE):
+        """Morning agenda for every master with bookings today"""
+        today = clock.today()
+        # Render everything first so sends are not interleaved with index reads
+        messages = []
+        for master_name, info in CONFIG["masters"].items():
+            text = NotificationSystem.render_digest(master_name, today)
+            if text:
+                messages.append((info["telegram_id"], text, None))
+        await NotificationSystem.send_batched(context.bot, messages)
+        logger.info(f"Sent daily digest to {len(messages)} masters")
+
+
+# ========================
+# BOOKING LIFECYCLE
+# ========================
+
+class BookingLifecycleSystem:
+    """Client cancellation and rescheduling of confirmed bookings"""
+    
+    @staticmethod
+    def get_own_booking(user_id: int, booking_id: str) -> Optional[Dict]:
+        """Return booking if it belongs to user and is still active"""
+        booking = bookings.get(booking_id)
+        if booking is None or booking["user_id"] != user_id or booking["status"] != "confirmed":
+            return None
+        return booking
+    
+    @staticmethod
+    async def handle_cancel_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ask client to confirm cancellation"""
+        query = update.callback_query
+        await query.answer()
+        
+        booking_id = query.data.replace("cancel_booking_", "")
+        booking = BookingLifecycleSystem.get_own_booking(query.from_user.id, booking_id)
+        if booking is None:
+            await query.edit_message_text(
+                "❌ *Запись не найдена или уже отменена*",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")]]),
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        keyboard = [
+            [InlineKeyboardButton("✅ Да, отменить", callback_data=f"cancel_confirm_{booking_id}")],
+            [InlineKeyboardButton("⬅️ Назад", callback_data="my_bookings")]
+        ]
+        await query.edit_message_text(
+            f"❓ *Отменить запись?*\n\n"
+            f"✂️ {booking['service']}\n"
+            f"👨‍💼 {booking['master']}\n"
+            f"📅 {booking['date']} ⏰ {booking['time']}",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def handle_cancel_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Cancel booking and notify master"""
+        query = update.callback_query
+        await query.answer()
+        
+        booking_id = query.data.replace("cancel_confirm_", "")
+        keyboard = [
+            [InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")],
+            [InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]
+        ]
+        
+        booking = None
+        if BookingLifecycleSystem.get_own_booking(query.from_user.id, booking_id):
+            booking = cancel_booking(booking_id)
+        if booking is None:
+            await query.edit_message_text(
+                "❌ *Запись не найдена или уже отменена*",
+                reply_markup=InlineKeyboardMarkup(keyboard),
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        await query.edit_message_text(
+            "✅ *Запись отменена*",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+        await WaitlistSystem.offer_slot(
+            context, booking["master"], parse_date(booking["date"]), parse_time(booking["time"])
+        )
+        NotificationSystem.queue(context, "cancel", booking)
+    
+    @staticmethod
+    async def handle_reschedule_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Start rescheduling: reuse date/time selection for the same master"""
+        query = update.callback_query
+        await query.answer()
+        
+        user_id = query.from_user.id
+        booking_id = query.data.replace("move_booking_", "")
+        booking = BookingLifecycleSystem.get_own_booking(user_id, booking_id)
+        if booking is None:
+            await query.edit_message_text(
+                "❌ *Запись не найдена или уже отменена*",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")]]),
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        user_sessions[user_id] = {
+            "reschedule": booking_id,
+            "service": booking["service"],
+            "master": booking["master"]
+        }
+        await show_date_selection(
+            query, booking["master"],
+            header=f"🔁 *Перенос записи с {booking['date']} {booking['time']}*\n\n"
+        )
+    
+    @staticmethod
+    async def complete_reschedule(query, context: ContextTypes.DEFAULT_TYPE, session: Dict):
+        """Move booking to the slot chosen in session"""
+        user_id = query.from_user.id
+        booking_id = session["reschedule"]
+        old = BookingLifecycleSystem.get_own_booking(user_id, booking_id)
+        booking = None
+        if old is not None:
+            old_day, old_slot = parse_date(old["date"]), parse_time(old["time"])
+            booking = reschedule_booking(booking_id, session["date"], session["time"])
+        
+        user_sessions[user_id] = {}
+        keyboard = [
+            [InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")],
+            [InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]
+        ]
+        
+        if booking is None:
+            await query.edit_message_text(
+                "⚠️ *Не удалось перенести запись.* Время уже недоступно или запись отменена.",
+                reply_markup=InlineKeyboardMarkup(keyboard),
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        await query.edit_message_text(
+            f"✅ *Запись перенесена!*\n\n"
+            f"✂️ {booking['service']}\n"
+            f"👨‍💼 {booking['master']}\n"
+            f"📅 {booking['date']} ⏰ {booking['time']}",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+        await WaitlistSystem.offer_slot(context, booking["master"], old_day, old_slot)
+        NotificationSystem.queue(context, "move", booking, old=(old_day, old_slot))
+
+
+# ========================
+# WAITLIST
+# ========================
+
+class WaitlistSystem:
+    """Waitlist for fully booked dates with first-come-first-served slot offers"""
+    
+    TIME_WINDOWS = {
+        "morning": ("00:00", "12:00", "Утро (до 12:00)"),
+        "day": ("12:00", "15:00", "День (12:00–15:00)"),
+        "evening": ("15:00", "24:00", "Вечер (после 15:00)"),
+        "any": ("00:00", "24:00", "Любое время"),
+    }
+    
+    @staticmethod
+    def describe(entry: Dict) -> str:
+        """Short human-readable description of an entry"""
+        master = entry["master"] or "любой мастер"
+        return f"{entry['service']}, {master}, {entry['start']}–{entry['end']}"
+    
+    @staticmethod
+    def user_entries(user_id: int) -> List[Dict]:
+        """User's waitlist entries by date"""
+        return sorted(
+            (waitlist[entry_id] for entry_id in user_waitlist_index.get(user_id, ())),
+            key=lambda e: e["date"]
+        )
+    
+    @staticmethod
+    def find_candidate(master_name: str, day: int, slot: int, skipped: set) -> Optional[Dict]:
+        """Earliest matching entry from the (master, date) and (any, date) buckets"""
+        holding_users = {hold["user_id"] for hold in holds.values()}
+        best = None
+        for key in ((master_name, day), ("*", day)):
+            for entry_id in waitlist_index.get(key, ()):
+                entry = waitlist[entry_id]
+                if (entry_id in skipped or entry["user_id"] in holding_users
+                        or not parse_time(entry["start"]) <= slot < parse_time(entry["end"])):
+                    continue
+                # Buckets are in FCFS order: first match is the best of its bucket
+                if best is None or entry["id"] < best["id"]:
+                    best = entry
+                break
+        return best
+    
+    @staticmethod
+    def release_hold(context: ContextTypes.DEFAULT_TYPE, hold: Dict):
+        """Drop hold and its timeout job"""
+        holds.pop(hold["id"], None)
+        key = (hold["master"], hold["date"])
+        day_holds = slot_holds.get(key)
+        # The slot may already be held for the next client in line
+        if day_holds is not None and day_holds.get(hold["time"]) == hold["id"]:
+            del day_holds[hold["time"]]
+            if not day_holds:
+                del slot_holds[key]
+        for job in context.job_queue.get_jobs_by_name(f"wl_hold_{hold['id']}"):
+            job.schedule_removal()
+    
+    @staticmethod
+    async def offer_slot(context: ContextTypes.DEFAULT_TYPE, master_name: str,
+                         day: int, slot: int, skipped: set = None):
+        """Offer a freed slot to the first matching waitlist entry and hold it"""
+        skipped = set(skipped or ())
+        while True:
+            if not is_slot_free(master_name, day, slot):
+                return
+            if not UltraCalendar(master_name).is_day_available(day):
+                return
+            entry = WaitlistSystem.find_candidate(master_name, day, slot, skipped)
+            if entry is None:
+                return
+            skipped.add(entry["id"])
+            
+            hold_id = next(_hold_ids)
+            hold = {
+                "id": hold_id,
+                "entry_id": entry["id"],
+                "user_id": entry["user_id"],
+                "service": entry["service"],
+                "master": master_name,
+                "date": day,
+                "time": slot,
+                "skipped": skipped
+            }
+            holds[hold_id] = hold
+            slot_holds.setdefault((master_name, day), {})[slot] = hold_id
+            
+            hold_minutes = CONFIG["waitlist"]["hold_minutes"]
+            keyboard = [[
+                InlineKeyboardButton("✅ Записаться", callback_data=f"wl_accept_{hold_id}"),
+                InlineKeyboardButton("❌ Не нужно", callback_data=f"wl_decline_{hold_id}")
+            ]]
+            try:
+                await context.bot.send_message(
+                    chat_id=entry["user_id"],
+                    text=(
+                        f"🎉 *Освободилось время!*\n\n"
+                        f"✂️ {entry['service']}\n"
+                        f"👨‍💼 {master_name}\n"
+                        f"📅 {format_date(day)} ⏰ {SLOT_TIMES[slot]}\n\n"
+                        f"Слот закреплён за вами на {hold_minutes} мин."
+                    ),
+                    reply_markup=InlineKeyboardMarkup(keyboard),
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            except Exception as e:
+                # Unreachable client: move on to the next one in line
+                logger.error(f"Error sending waitlist offer: {e}")
+                WaitlistSystem.release_hold(context, hold)
+                continue
+            
+            context.job_queue.run_once(
+                WaitlistSystem.hold_expired,
+                when=hold_minutes * 60,
+                data=hold_id,
+                name=f"wl_hold_{hold_id}"
+            )
+            return
+    
+    @staticmethod
+    async def hold_expired(context: ContextTypes.DEFAULT_TYPE):
+        """Offer timed out: pass the slot to the next entry"""
+        hold = holds.get(context.job.data)
+        if hold is None:
+            return
+        WaitlistSystem.release_hold(context, hold)
+        await WaitlistSystem.offer_slot(
+            context, hold["master"], hold["date"], hold["time"], hold["skipped"]
+        )
+    
+    @staticmethod
+    async def handle_join(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Choose between the selected master and any master"""
+        query = update.callback_query
+        await query.answer()
+        
+        session = user_sessions.get(query.from_user.id, {})
+        if not {"service", "master", "date"} <= session.keys():
+            await query.edit_message_text(
+                "❌ *Сессия устарела, начните запись заново*",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("📅 Записаться", callback_data="start_booking")]]),
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        keyboard = [
+            [InlineKeyboardButton(f"👨‍💼 Только {session['master']}", callback_data="wl_scope_master")],
+            [InlineKeyboardButton("👥 Любой мастер", callback_data="wl_scope_any")],
+            [InlineKeyboardButton("⬅️ Назад", callback_data="start_booking")]
+        ]
+        await query.edit_message_text(
+            f"🕒 *Лист ожидания на {format_date(session['date'])}*\n\n"
+            f"Мы предложим вам время, как только оно освободится.\n"
+            f"К какому мастеру?",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def handle_scope(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Choose preferred time window"""
+        query = update.callback_query
+        await query.answer()
+        
+        session = user_sessions.get(query.from_user.id, {})
+        if "date" not in session:
+            await query.edit_message_text("❌ *Сессия устарела*", parse_mode=ParseMode.MARKDOWN)
+            return
+        session["waitlist_any_master"] = query.data == "wl_scope_any"
+        
+        keyboard = [
+            [InlineKeyboardButton(label, callback_data=f"wl_window_{key}")]
+            for key, (_, _, label) in WaitlistSystem.TIME_WINDOWS.items()
+        ]
+        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="wl_join")])
+        await query.edit_message_text(
+            "🕒 *Какое время вам подходит?*",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def handle_window(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Register waitlist entry"""
+        query = update.callback_query
+        await query.answer()
+        
+        user_id = query.from_user.id
+        session = user_sessions.get(user_id, {})
+        window = WaitlistSystem.TIME_WINDOWS.get(query.data.replace("wl_window_", ""))
+        if "date" not in session or window is None:
+            await query.edit_message_text("❌ *Сессия устарела*", parse_mode=ParseMode.MARKDOWN)
+            return
+        
+        entry = {
+            "id": journal.seq + 1,
+            "user_id": user_id,
+            "service": session["service"],
+            "master": None if session.get("waitlist_any_master") else session["master"],
+            "date": iso_date(session["date"]),
+            "start": window[0],
+            "end": window[1],
+            "created_at": clock.now().isoformat()
+        }
+        apply_journal_record(journal.append("wait", e=entry))
+        session_date = session["date"]
+        user_sessions[user_id] = {}
+        
+        keyboard = [
+            [InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")],
+            [InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]
+        ]
+        await query.edit_message_text(
+            f"✅ *Вы в листе ожидания*\n\n"
+            f"📅 {format_date(session_date)}\n"
+            f"{WaitlistSystem.describe(entry)}\n\n"
+            f"Сообщим, как только появится свободное время.",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def handle_leave(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Remove user's waitlist entry"""
+        query = update.callback_query
+        
+        entry_id = int(query.data.replace("wl_leave_", ""))
+        entry = waitlist.get(entry_id)
+        if entry is not None and entry["user_id"] == query.from_user.id:
+            apply_journal_record(journal.append("unwait", id=entry_id))
+        await my_bookings(update, context)
+    
+    @staticmethod
+    async def handle_accept(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Book the held slot for the offered client"""
+        query = update.callback_query
+        await query.answer()
+        
+        hold = holds.get(int(query.data.replace("wl_accept_", "")))
+        if hold is None or hold["user_id"] != query.from_user.id:
+            await query.edit_message_text(
+                "⌛ *Предложение истекло.* Вы остаётесь в листе ожидания.",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        WaitlistSystem.release_hold(context, hold)
+        booking = create_booking(
+            hold["user_id"], hold["service"], hold["master"], hold["date"], hold["time"]
+        )
+        apply_journal_record(journal.append("unwait", id=hold["entry_id"]))
+        
+        keyboard = [[InlineKeyboardButton("📋 Мои записи", callback_data="my_bookings")]]
+        await query.edit_message_text(
+            f"✅ *Запись успешно создана!*\n\n"
+            f"ID: `{booking['id']}`\n"
+            f"✂️ {booking['service']}\n"
+            f"👨‍💼 {booking['master']}\n"
+            f"📅 {booking['date']} ⏰ {booking['time']}\n"
+            f"💰 {booking['price']}₽",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+        NotificationSystem.queue(context, "new", booking)
+    
+    @staticmethod
+    async def handle_decline(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Client declined: pass the slot to the next entry"""
+        query = update.callback_query
+        await query.answer()
+        
+        await query.edit_message_text(
+            "👌 *Хорошо, вы остаётесь в листе ожидания.*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        # Looked up after the edit: the hold may have expired meanwhile
+        hold = holds.get(int(query.data.replace("wl_decline_", "")))
+        if hold is None or hold["user_id"] != query.from_user.id:
+            return
+        WaitlistSystem.release_hold(context, hold)
+        await WaitlistSystem.offer_slot(
+            context, hold["master"], hold["date"], hold["time"], hold["skipped"]
+        )
+
+
+# ========================
+# CLIENT PROFILES
+# ========================
+
+class ClientSystem:
+    """Phone capture, quick rebooking and admin client lookup"""
+    
+    @staticmethod
+    def label(profile: Dict) -> str:
+        """Name and phone for lists and notifications (escape it for Markdown text)"""
+        name = " ".join(filter(None, (profile.get("first_name"), profile.get("last_name"))))
+        label = name or f"ID {profile['user_id']}"
+        if profile.get("phone"):
+            label += f", +{profile['phone']}"
+        return label
+    
+    @staticmethod
+    async def request_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show the share-contact keyboard"""
+        query = update.callback_query
+        await query.answer()
+        
+        keyboard = [[KeyboardButton("📱 Отправить номер", request_contact=True)]]
+        await query.message.reply_text(
+            "📱 *Нажмите кнопку ниже, чтобы поделиться номером телефона.*\n\n"
+            "Мастер сможет связаться с вами, если планы изменятся.",
+            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Save phone from a shared contact"""
+        user = update.effective_user
+        contact = update.message.contact
+        if contact.user_id != user.id:
+            await update.message.reply_text(
+                "❌ *Пожалуйста, отправьте свой номер кнопкой «📱 Отправить номер».*",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        phone = normalize_phone(contact.phone_number)
+        record_client(user.id, phone=phone)
+        await update.message.reply_text(
+            f"✅ *Телефон сохранён:* +{phone}",
+            reply_markup=ReplyKeyboardRemove(),
+            parse_mode=ParseMode.MARKDOWN
+        )
+        await update.message.reply_text(
+            "Что дальше?",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]])
+        )
+    
+    @staticmethod
+    async def rebook(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Repeat last service with the same master, starting at the nearest free day"""
+        query = update.callback_query
+        await query.answer()
+        
+        user_id = query.from_user.id
+        last = client_data.get(user_id, {}).get("last_booking")
+        if not last or last["service"] not in CONFIG["services"] or last["master"] not in CONFIG["masters"]:
+            await query.edit_message_text(
+                "❌ *Эта услуга больше недоступна.* Выберите новую.",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("📅 Записаться", callback_data="start_booking")]]),
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        
+        user_sessions[user_id] = {"service": last["service"], "master": last["master"]}
+        calendar = UltraCalendar(last["master"])
+        today = clock.today()
+        day = next((today + i for i in range(14) if calendar.available_slots(today + i)), None)
+        if day is None:
+            await show_date_selection(query, last["master"])
+            return
+        await show_time_selection(query, user_id, day, header="🔁 *Повторная запись*\n\n")
+    
+    @staticmethod
+    async def request_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ask admin for a phone or name prefix"""
+        query = update.callback_query
+        await query.answer()
+        
+        if query.from_user.id != CONFIG["admin_id"]:
+            await query.edit_message_text("❌ Доступ запрещен")
+            return
+        
+        user_sessions[query.from_user.id] = {"awaiting": "client_search"}
+        await query.edit_message_text(
+            f"🔎 *Поиск клиента*\n\n"
+            f"Клиентов в базе: {len(client_data)}\n\n"
+            f"Отправьте телефон или начало имени, например `+7999` или `анн`.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="admin_panel")]]),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def handle_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show clients matching admin's text; stays in search mode for refinement"""
+        if update.effective_user.id != CONFIG["admin_id"]:
+            return
+        
+        found = search_clients(update.message.text)
+        keyboard = [
+            [InlineKeyboardButton(f"👤 {ClientSystem.label(profile)}", callback_data=f"admin_client_{profile['user_id']}")]
+            for profile in found
+        ]
+        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="admin_panel")])
+        await update.message.reply_text(
+            f"🔎 *Найдено: {len(found)}*" + ("" if found else "\n\nУточните запрос."),
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Client card with contact and booking history"""
+        query = update.callback_query
+        await query.answer()
+        
+        if query.from_user.id != CONFIG["admin_id"]:
+            await query.edit_message_text("❌ Доступ запрещен")
+            return
+        
+        profile = client_data.get(int(query.data.replace("admin_client_", "")))
+        if profile is None:
+            await query.edit_message_text("❌ Клиент не найден")
+            return
+        
+        history = sorted(
+            (bookings[booking_id] for booking_id in user_bookings_index.get(profile["user_id"], ())),
+            key=lambda b: (b["date"], b["time"]),
+            reverse=True
+        )
+        text = (
+            f"👤 *Клиент:* {escape_markdown(ClientSystem.label(profile))}\n"
+            f"ID: `{profile['user_id']}`\n\n"
+        )
+        last = profile.get("last_booking")
+        if last:
+            text += f"🔁 Последняя запись: {last['service']} у {last['master']}\n\n"
+        # Past visits moved to the archive every night
+        visits = archive.user_rows(profile["user_id"], 10)
+        if not history and not visits:
+            text += "Записей нет\n"
+        if history:
+            text += "*Записи:*\n"
+        for booking in history[:10]:
+            status = "✅" if booking["status"] == "confirmed" else "❌"
+            text += (
+                f"{status} {format_date(parse_date(booking['date']))} {booking['time']} — "
+                f"{booking['service']}, {booking['master']}\n"
+            )
+        if visits:
+            text += "\n*Прошедшие визиты:*\n"
+        for visit_date, visit_time, master, service, _, status, _ in visits:
+            status = "✅" if status == "confirmed" else "❌"
+            text += f"{status} {format_date(parse_date(visit_date))} {visit_time} — {service}, {master}\n"
+        
+        await query.edit_message_text(
+            text,
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="admin_clients")]]),
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+
+# ========================
+# RATINGS & REVIEWS
+# ========================
+
+class RatingSystem:
+    """Post-visit rating prompts, reviews and per-master scores"""
+    
+    @staticmethod
+    async def prompt_job(context: ContextTypes.DEFAULT_TYPE):
+        """Ask clients to rate finished visits that are still in the live store"""
+        today = clock.today()
+        last_slot = clock.current_slot() - CONFIG["ratings"]["prompt_after_minutes"] // SLOT_MINUTES
+        messages = []
+        # Earlier days catch up on visits that finished after the last run of
+        # the evening or while the bot was down; archive_job runs this first
+        days = [(day, SLOTS_PER_DAY) for day in range(today - CONFIG["ratings"]["answer_days"], today)]
+        days.append((today, last_slot))
+        for master_name, (day, day_last_slot) in itertools.product(CONFIG["masters"], days):
+            for slot, booking_id in sorted(slot_index.get((master_name, day), {}).items()):
+                if slot > day_last_slot:
+                    break
+                if booking_id in pending_ratings or booking_id in reviews:
+                    continue
+                booking = bookings[booking_id]
+                prompt = {
+                    field: booking[field] for field in ("user_id", "master", "service", "date", "time")
+                }
+                prompt["booking_id"] = booking_id
+                apply_journal_record(journal.append("prompt", p=prompt))
+                keyboard = [[
+                    InlineKeyboardButton("⭐" * stars, callback_data=f"rate_{booking_id}_{stars}")
+                    for stars in range(1, 6)
+                ]]
+                messages.append((
+                    booking["user_id"],
+                    f"💬 *Как прошёл визит?*\n\n"
+                    f"✂️ {booking['service']}\n"
+                    f"👨‍💼 {booking['master']}\n\n"
+                    f"Оцените работу мастера:",
+                    InlineKeyboardMarkup(keyboard)
+                ))
+        await NotificationSystem.send_batched(context.bot, messages)
+    
+    @staticmethod
+    async def handle_rating(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Store star rating and offer to add a text review"""
+        query = update.callback_query
+        await query.answer()
+        
+        booking_id, stars = query.data.replace("rate_", "", 1).rsplit("_", 1)
+        prompt = pending_ratings.get(booking_id)
+        if (prompt is None or prompt["user_id"] != query.from_user.id
+                or stars not in ("1", "2", "3", "4", "5")):
+            await query.edit_message_text("⌛ *Оценка уже учтена или срок истёк*", parse_mode=ParseMode.MARKDOWN)
+            return
+        
+        review = dict(prompt, stars=int(stars), text="", at=clock.now().isoformat())
+        apply_journal_record(journal.append("review", r=review))
+        
+        keyboard = [
+            [InlineKeyboardButton("✍️ Написать отзыв", callback_data=f"review_{booking_id}")],
+            [InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]
+        ]
+        await query.edit_message_text(
+            f"🙏 *Спасибо за оценку!* {'⭐' * int(stars)}\n\n"
+            f"Хотите добавить пару слов о визите?",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def request_review_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Wait for review text"""
+        query = update.callback_query
+        await query.answer()
+        
+        booking_id = query.data.replace("review_", "", 1)
+        review = reviews.get(booking_id)
+        if review is None or review["user_id"] != query.from_user.id:
+            await query.edit_message_text("❌ Отзыв не найден")
+            return
+        
+        user_sessions[query.from_user.id] = {"awaiting": f"review_{booking_id}"}
+        await query.edit_message_text(
+            "✍️ *Напишите отзыв одним сообщением*",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]]),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def handle_review_text(update: Update, context: ContextTypes.DEFAULT_TYPE, booking_id: str):
+        """Attach text to an existing review"""
+        user_id = update.effective_user.id
+        user_sessions.pop(user_id, None)
+        review = reviews.get(booking_id)
+        if review is None or review["user_id"] != user_id:
+            return
+        
+        apply_journal_record(journal.append("review", r=dict(review, text=update.message.text[:1000])))
+        await update.message.reply_text(
+            "✅ *Отзыв сохранён. Спасибо!*",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("☰ Меню", callback_data="back_to_client")]]),
+            parse_mode=ParseMode.MARKDOWN
+        )
+        master_info = CONFIG["masters"].get(review["master"])
+        if master_info:
+            try:
+                # Plain text: client's words may contain Markdown control characters
+                await context.bot.send_message(
+                    chat_id=master_info["telegram_id"],
+                    text=f"💬 Новый отзыв {'⭐' * review['stars']}\n\n{update.message.text[:1000]}"
+                )
+            except Exception as e:
+                logger.error(f"Error forwarding review to {review['master']}: {e}")
+
+
 async def open_webapp(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Open mini app web application"""
     query = update.callback_query
@@ -710,8 +2761,8 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("❌ Доступ запрещен")
         return
     
-    total_bookings = len([b for b in bookings.values() if b["status"] == "confirmed"])
-    total_revenue = sum(b["price"] for b in bookings.values() if b["status"] == "confirmed")
+    total_bookings = analytics_data.get("total_bookings", 0)
+    total_revenue = analytics_data.get("total_revenue", 0)
     
     stats_text = (
         f"👨‍💼 *Админ панель {CONFIG['salon_name']}*\n\n"
@@ -725,6 +2776,8 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("👨‍💼 Управление мастерами", callback_data="admin_masters")],
         [InlineKeyboardButton("⚙️ Настройки", callback_data="admin_settings")],
         [InlineKeyboardButton("📈 Аналитика", callback_data="admin_analytics")],
+        [InlineKeyboardButton("📤 Экспорт", callback_data="admin_export")],
+        [InlineKeyboardButton("🔎 Клиенты", callback_data="admin_clients")],
         [InlineKeyboardButton("⬅️ Назад", callback_data="show_roles")]
     ]
     
@@ -788,8 +2841,8 @@ async def admin_analytics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     # Calculate statistics
-    total_bookings = len([b for b in bookings.values() if b["status"] == "confirmed"])
-    total_revenue = sum(b["price"] for b in bookings.values() if b["status"] == "confirmed")
+    total_bookings = analytics_data.get("total_bookings", 0)
+    total_revenue = analytics_data.get("total_revenue", 0)
     
     analytics_text = (
         "📈 *Аналитика*\n\n"
@@ -802,6 +2855,12 @@ async def admin_analytics(update: Update, context: ContextTypes.DEFAULT_TYPE):
         analytics_text += f"• {master_name}: {stats['bookings']} записей, {stats['revenue']}₽\n"
     
     keyboard = [
+        [
+            InlineKeyboardButton("7 дней", callback_data="analytics_range_7"),
+            InlineKeyboardButton("30 дней", callback_data="analytics_range_30"),
+            InlineKeyboardButton("Год", callback_data="analytics_range_365")
+        ],
+        [InlineKeyboardButton("🔥 Загрузка по часам", callback_data="analytics_heatmap_90")],
         [InlineKeyboardButton("⬅️ Назад", callback_data="admin_panel")]
     ]
     
@@ -812,6 +2871,565 @@ async def admin_analytics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+class AnalyticsSystem:
+    """Date-range analytics over the archive and live store"""
+    
+    WEEKDAYS = ["ПН", "ВТ", "СР", "ЧТ", "ПТ", "СБ", "ВС"]
+    SHADES = " ░▒▓█"
+    
+    @staticmethod
+    def period(days: int) -> tuple:
+        """Last `days` days including today, as date ordinals"""
+        end = clock.today()
+        return end - days + 1, end
+    
+    @staticmethod
+    async def show_range(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Totals, per-master and per-service breakdown for a period"""
+        query = update.callback_query
+        await query.answer()
+        
+        if query.from_user.id != CONFIG["admin_id"]:
+            await query.edit_message_text("❌ Доступ запрещен")
+            return
+        
+        days = int(query.data.replace("analytics_range_", ""))
+        start, end = AnalyticsSystem.period(days)
+        stats = range_analytics(start, end)
+        
+        text = (
+            f"📈 *Аналитика {format_date(start)} — {format_date(end)}*\n\n"
+            f"📊 Записей: {stats['bookings']}\n"
+            f"💰 Доход: {stats['revenue']}₽\n\n"
+            f"*По мастерам:*\n"
+        )
+        for name, (count, revenue) in sorted(stats["master"].items(), key=lambda i: -i[1][1]):
+            text += f"• {name}: {count} записей, {revenue}₽\n"
+        text += "\n*По услугам:*\n"
+        for name, (count, revenue) in sorted(stats["service"].items(), key=lambda i: -i[1][1]):
+            text += f"• {name}: {count} записей, {revenue}₽\n"
+        
+        keyboard = [
+            [InlineKeyboardButton("🔥 Загрузка по часам", callback_data=f"analytics_heatmap_{days}")],
+            [InlineKeyboardButton("⬅️ Назад", callback_data="admin_analytics")]
+        ]
+        await query.edit_message_text(
+            text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def show_heatmap(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Weekday x hour booking heatmap for a period"""
+        query = update.callback_query
+        await query.answer()
+        
+        if query.from_user.id != CONFIG["admin_id"]:
+            await query.edit_message_text("❌ Доступ запрещен")
+            return
+        
+        days = int(query.data.replace("analytics_heatmap_", ""))
+        start, end = AnalyticsSystem.period(days)
+        grid = range_heatmap(start, end)
+        
+        working_hours = CONFIG["salon_info"]["working_hours"]
+        start_hour = int(working_hours["start"].split(":")[0])
+        end_hour = int(working_hours["end"].split(":")[0])
+        slots_per_hour = 60 // SLOT_MINUTES
+        hourly = [
+            [sum(row[hour * slots_per_hour:(hour + 1) * slots_per_hour])
+             for hour in range(start_hour, end_hour)]
+            for row in grid
+        ]
+        peak = max(max(row) for row in hourly) or 1
+        
+        lines = ["    " + "".join(f"{hour:<3d}" for hour in range(start_hour, end_hour))]
+        for weekday, row in zip(AnalyticsSystem.WEEKDAYS, hourly):
+            cells = "".join(
+                AnalyticsSystem.SHADES[-(-count * (len(AnalyticsSystem.SHADES) - 1) // peak)] * 2 + " "
+                for count in row
+            )
+            lines.append(f"{weekday}  {cells}")
+        
+        text = (
+            f"🔥 *Загрузка {format_date(start)} — {format_date(end)}*\n\n"
+            "```\n" + "\n".join(lines) + "\n```\n"
+            f"█ — пик ({peak} записей в час)"
+        )
+        keyboard = [
+            [InlineKeyboardButton("⬅️ Назад", callback_data="admin_analytics")]
+        ]
+        await query.edit_message_text(
+            text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+
+class ExportSystem:
+    """Streaming CSV/NDJSON export of bookings and per-master revenue"""
+    
+    FIELDS = ("id", "date", "time", "master", "service", "price", "status", "user_id")
+    PERIODS = {"7": "7 дней", "30": "30 дней", "90": "90 дней", "365": "Год", "all": "Всё время"}
+    CHUNK_SIZE = 10000
+    SPOOL_MAX_SIZE = 1024 * 1024  # Larger exports spill to disk
+    # Compressed size per bookings part: the Bot API rejects documents over 50 MB
+    PART_MAX_SIZE = 45 * 1024 * 1024
+    
+    @staticmethod
+    def period(key: str) -> tuple:
+        """(start, end) date ordinals for a period key; None means unbounded"""
+        if key == "all":
+            return None, None
+        return clock.today() - int(key) + 1, None
+    
+    @staticmethod
+    def iter_booking_chunks(start: Optional[int], end: Optional[int]):
+        """Yield chunks of export rows: archive first, then live bookings"""
+        for rows in archive.iter_chunks(start, end, ExportSystem.CHUNK_SIZE):
+            yield [("",) + row for row in rows]
+        
+        start_str = iso_date(start) if start else ""
+        end_str = iso_date(end) if end else "9999-12-31"
+        live = sorted(
+            (b for b in bookings.values() if start_str <= b["date"] <= end_str),
+            key=lambda b: (b["date"], b["time"])
+        )
+        for i in range(0, len(live), ExportSystem.CHUNK_SIZE):
+            yield [tuple(b[field] for field in ExportSystem.FIELDS)
+                   for b in live[i:i + ExportSystem.CHUNK_SIZE]]
+    
+    @staticmethod
+    def encode_rows(rows: List[tuple], fmt: str, fields: tuple) -> bytes:
+        """Encode rows as CSV lines or NDJSON records"""
+        if fmt == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            return buffer.getvalue().encode("utf-8")
+        return "".join(
+            json.dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n" for row in rows
+        ).encode("utf-8")
+    
+    @staticmethod
+    async def write_export(parts: List, new_file, revenue_file, start, end, fmt: str) -> int:
+        """Stream bookings into gzipped parts and revenue into `revenue_file`
+
+        Each part is a file from `new_file()` appended to `parts`: a complete
+        .gz with its own header, under PART_MAX_SIZE compressed.
+        """
+        fields = ExportSystem.FIELDS
+        revenue_fields = ("master", "bookings", "revenue")
+        header = b""
+        if fmt == "csv":
+            # BOM lets Excel detect UTF-8 (Cyrillic names)
+            header = b"\xef\xbb\xbf" + ExportSystem.encode_rows([fields], fmt, fields)
+            revenue_file.write(b"\xef\xbb\xbf" + ExportSystem.encode_rows([revenue_fields], fmt, revenue_fields))
+        
+        parts.append(new_file())
+        part = gzip.GzipFile(mode="wb", fileobj=parts[-1])
+        part.write(header)
+        revenue = {}
+        total = 0
+        for rows in ExportSystem.iter_booking_chunks(start, end):
+            data = ExportSystem.encode_rows(rows, fmt, fields)
+            # Compressed output never outgrows its input by more than a few bytes;
+            # the margin under 50 MB covers what zlib still buffers
+            if parts[-1].tell() + len(data) > ExportSystem.PART_MAX_SIZE:
+                part.close()
+                parts.append(new_file())
+                part = gzip.GzipFile(mode="wb", fileobj=parts[-1])
+                part.write(header)
+            part.write(data)
+            for row in rows:
+                if row[6] == "confirmed":
+                    totals = revenue.setdefault(row[3], [0, 0])
+                    totals[0] += 1
+                    totals[1] += row[5]
+            total += len(rows)
+            # Let other updates through between chunks
+            await asyncio.sleep(0)
+        part.close()
+        
+        revenue_rows = [(name, count, amount) for name, (count, amount) in sorted(revenue.items())]
+        revenue_file.write(ExportSystem.encode_rows(revenue_rows, fmt, revenue_fields))
+        return total
+    
+    @staticmethod
+    async def show_export_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Choose export period"""
+        query = update.callback_query
+        await query.answer()
+        
+        if query.from_user.id != CONFIG["admin_id"]:
+            await query.edit_message_text("❌ Доступ запрещен")
+            return
+        
+        keyboard = [
+            [InlineKeyboardButton(label, callback_data=f"export_period_{key}")]
+            for key, label in ExportSystem.PERIODS.items()
+        ]
+        keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="admin_panel")])
+        
+        await query.edit_message_text(
+            "📤 *Экспорт записей и выручки*\n\nВыберите период:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def show_format_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Choose export format"""
+        query = update.callback_query
+        await query.answer()
+        
+        if query.from_user.id != CONFIG["admin_id"]:
+            await query.edit_message_text("❌ Доступ запрещен")
+            return
+        
+        period = query.data.replace("export_period_", "")
+        keyboard = [
+            [
+                InlineKeyboardButton("📄 CSV", callback_data=f"export_run_{period}_csv"),
+                InlineKeyboardButton("🧾 NDJSON", callback_data=f"export_run_{period}_ndjson")
+            ],
+            [InlineKeyboardButton("⬅️ Назад", callback_data="admin_export")]
+        ]
+        
+        await query.edit_message_text(
+            f"📤 *Экспорт: {ExportSystem.PERIODS.get(period, period)}*\n\nВыберите формат:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def run_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Build export in spooled temp files and send as gzipped documents"""
+        query = update.callback_query
+        await query.answer()
+        
+        if query.from_user.id != CONFIG["admin_id"]:
+            await query.edit_message_text("❌ Доступ запрещен")
+            return
+        
+        period, fmt = query.data.replace("export_run_", "").rsplit("_", 1)
+        start, end = ExportSystem.period(period)
+        suffix = f"{iso_date(start) if start else 'all'}_{iso_date(clock.today())}"
+        
+        await query.edit_message_text("⏳ *Готовлю выгрузку...*", parse_mode=ParseMode.MARKDOWN)
+        
+        new_file = partial(tempfile.SpooledTemporaryFile, ExportSystem.SPOOL_MAX_SIZE)
+        parts = []
+        try:
+            with new_file() as revenue_file:
+                total = await ExportSystem.write_export(parts, new_file, revenue_file, start, end, fmt)
+                for number, part in enumerate(parts, 1):
+                    name = f"bookings_{suffix}"
+                    if len(parts) > 1:
+                        name += f"_part{number}of{len(parts)}"
+                    part.seek(0)
+                    # PTB reads the whole document into memory for upload
+                    await context.bot.send_document(
+                        chat_id=query.from_user.id,
+                        document=part,
+                        filename=f"{name}.{fmt}.gz"
+                    )
+                    part.close()
+                revenue_file.seek(0)
+                await context.bot.send_document(
+                    chat_id=query.from_user.id,
+                    document=revenue_file,
+                    filename=f"revenue_{suffix}.{fmt}"
+                )
+        except Exception as e:
+            logger.error(f"Error sending export: {e}")
+            await query.edit_message_text("❌ *Не удалось отправить выгрузку*", parse_mode=ParseMode.MARKDOWN)
+            return
+        finally:
+            for part in parts:
+                part.close()
+        
+        keyboard = [[InlineKeyboardButton("⬅️ Назад", callback_data="admin_panel")]]
+        await query.edit_message_text(
+            f"✅ *Выгрузка готова:* {total} записей, файлов: {len(parts) + 1}",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+
+def find_master_name(user_id: int) -> Optional[str]:
+    """Master name registered for Telegram user"""
+    for name, info in CONFIG["masters"].items():
+        if info["telegram_id"] == user_id:
+            return name
+    return None
+
+
+class ScheduleSystem:
+    """Master-facing editor for vacations, shifts and breaks"""
+    
+    WEEKDAYS = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"]
+    DATE_RE = r"(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?"
+    TIME_RANGE_RE = r"(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})"
+    
+    PROMPTS = {
+        "off": (
+            "🏖 *Выходные и отпуск*\n\n"
+            "Отправьте даты:\n"
+            "• `25.11` — один день\n"
+            "• `01.12-14.12` — период\n"
+            "• `пт 11` — каждая пятница ноября"
+        ),
+        "on": (
+            "💼 *Вернуть рабочие дни*\n\n"
+            "Отправьте даты в том же формате: `25.11`, `01.12-14.12`, `пт 11`"
+        ),
+        "shift": (
+            "⏰ *Смена и перерывы*\n\n"
+            "Отправьте даты, время смены и перерывы:\n"
+            "• `25.11 10:00-16:00`\n"
+            "• `пн 12 09:00-15:00 перерыв 12:00-12:30`\n"
+            "• `25.11 сброс` — обычный график"
+        ),
+    }
+    
+    @staticmethod
+    def _parse_day(match, today: date) -> date:
+        day, month, year = int(match[0]), int(match[1]), match[2]
+        if year:
+            return date(int(year), month, day)
+        candidate = date(today.year, month, day)
+        # Dates without a year refer to the upcoming occurrence
+        return candidate if candidate >= today else date(today.year + 1, month, day)
+    
+    @staticmethod
+    def _parse_clock(time_str: str) -> int:
+        """"HH:MM" -> minutes, clamped to 24:00; rejects 25:00 and 12:75"""
+        hours, minutes = (int(part) for part in time_str.split(":"))
+        if hours > 24 or minutes > 59:
+            raise ValueError(f"bad time {time_str}")
+        return min(hours * 60 + minutes, SLOTS_PER_DAY * SLOT_MINUTES)
+    
+    @staticmethod
+    def parse_dates(text: str, today: date) -> tuple:
+        """Parse date spec at the start of `text`; returns (dates, rest of text)"""
+        text = text.strip().lower()
+        
+        weekday_match = re.match(r"(пн|вт|ср|чт|пт|сб|вс)\s+(\d{1,2})(?:\.(\d{4}))?", text)
+        if weekday_match:
+            weekday = ScheduleSystem.WEEKDAYS.index(weekday_match[1])
+            month = int(weekday_match[2])
+            year = int(weekday_match[3]) if weekday_match[3] else (
+                today.year if month >= today.month else today.year + 1
+            )
+            days_in_month = calendar.monthrange(year, month)[1]
+            dates = [
+                date(year, month, day) for day in range(1, days_in_month + 1)
+                if date(year, month, day).weekday() == weekday
+            ]
+            return dates, text[weekday_match.end():]
+        
+        range_match = re.match(ScheduleSystem.DATE_RE + r"\s*-\s*" + ScheduleSystem.DATE_RE, text)
+        if range_match:
+            start = ScheduleSystem._parse_day(range_match.groups()[:3], today)
+            end = ScheduleSystem._parse_day(range_match.groups()[3:], today)
+            if end < start:
+                raise ValueError("end before start")
+            return [start + timedelta(days=i) for i in range((end - start).days + 1)], text[range_match.end():]
+        
+        day_match = re.match(ScheduleSystem.DATE_RE, text)
+        if day_match:
+            return [ScheduleSystem._parse_day(day_match.groups(), today)], text[day_match.end():]
+        
+        raise ValueError("no dates")
+    
+    @staticmethod
+    def apply_change(master_name: str, action: str, text: str, today: date) -> tuple:
+        """Apply editor input as interval-set updates; returns (dates, schedule)"""
+        dates, rest = ScheduleSystem.parse_dates(text, today)
+        schedule = master_schedules.get(master_name, {})
+        schedule = {
+            "vacations": list(schedule.get("vacations", [])),
+            "days": dict(schedule.get("days", {}))
+        }
+        
+        if action in ("off", "on"):
+            update = add_date_interval if action == "off" else remove_date_interval
+            for start, end in dates_to_intervals(dates):
+                schedule["vacations"] = update(schedule["vacations"], start, end)
+        else:
+            rest = rest.strip()
+            if rest == "сброс":
+                for day in dates:
+                    schedule["days"].pop(day.isoformat(), None)
+            else:
+                ranges = re.findall(ScheduleSystem.TIME_RANGE_RE, rest)
+                if not ranges:
+                    raise ValueError("no shift")
+                start, end = (ScheduleSystem._parse_clock(t) for t in ranges[0])
+                if start >= end:
+                    raise ValueError("empty shift")
+                breaks = []
+                for pair in ranges[1:]:
+                    break_start, break_end = (ScheduleSystem._parse_clock(t) for t in pair)
+                    if not start <= break_start < break_end <= end:
+                        raise ValueError("break outside shift")
+                    breaks.append([_minutes_to_time(break_start), _minutes_to_time(break_end)])
+                # Normalize "9:00" -> "09:00"
+                shift = [_minutes_to_time(start), _minutes_to_time(end)]
+                for day in dates:
+                    schedule["days"][day.isoformat()] = {"shift": shift, "breaks": breaks}
+        
+        affected = {day.isoformat() for day in dates}
+        record_master_schedule(master_name, schedule, affected)
+        return dates, schedule
+    
+    @staticmethod
+    async def show_editor(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Schedule editor menu"""
+        query = update.callback_query
+        await query.answer()
+        
+        master_name = find_master_name(query.from_user.id)
+        if not master_name:
+            await query.edit_message_text("❌ Вы не зарегистрированы как мастер")
+            return
+        user_sessions.pop(query.from_user.id, None)
+        
+        schedule = master_schedules.get(master_name, {})
+        today_str = iso_date(clock.today())
+        vacations = [v for v in schedule.get("vacations", []) if v["end"] >= today_str]
+        custom_days = sorted(d for d in schedule.get("days", {}) if d >= today_str)
+        
+        text = f"✏️ *Расписание: {master_name}*\n\n"
+        text += "*Выходные и отпуск:*\n"
+        text += "".join(
+            f"  • {v['start']}" + (f" — {v['end']}" if v["end"] != v["start"] else "") + "\n"
+            for v in vacations[:15]
+        ) or "  нет\n"
+        text += f"\n*Особых смен:* {len(custom_days)}\n"
+        
+        keyboard = [
+            [InlineKeyboardButton("🏖 Выходные / отпуск", callback_data="sched_input_off")],
+            [InlineKeyboardButton("💼 Вернуть рабочие дни", callback_data="sched_input_on")],
+            [InlineKeyboardButton("⏰ Смена и перерывы", callback_data="sched_input_shift")],
+            [InlineKeyboardButton("🗓 Неделя", callback_data="sched_week_0")],
+            [InlineKeyboardButton("⬅️ Назад", callback_data="master_panel")]
+        ]
+        await query.edit_message_text(
+            text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def request_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Ask master for dates / shift text"""
+        query = update.callback_query
+        await query.answer()
+        
+        if not find_master_name(query.from_user.id):
+            await query.edit_message_text("❌ Вы не зарегистрированы как мастер")
+            return
+        
+        action = query.data.replace("sched_input_", "")
+        user_sessions[query.from_user.id] = {"awaiting": f"schedule_{action}"}
+        await query.edit_message_text(
+            ScheduleSystem.PROMPTS[action],
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="sched_edit")]]),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    @staticmethod
+    async def handle_input(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str):
+        """Apply master's schedule text input"""
+        user_id = update.effective_user.id
+        master_name = find_master_name(user_id)
+        if not master_name:
+            return
+        
+        back = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ К расписанию", callback_data="sched_edit")]])
+        try:
+            dates, _ = ScheduleSystem.apply_change(master_name, action, update.message.text,
+                                               date.fromordinal(clock.today()))
+        except ValueError:
+            await update.message.reply_text(
+                "❌ *Не удалось разобрать.* Попробуйте ещё раз.\n\n" + ScheduleSystem.PROMPTS[action],
+                reply_markup=back,
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
+        user_sessions.pop(user_id, None)
+        
+        days = sorted(day.toordinal() for day in dates)
+        booked = sum(len(slot_index.get((master_name, day), ())) for day in days)
+        text = f"✅ *Расписание обновлено:* {len(dates)} дн. ({iso_date(days[0])} — {iso_date(days[-1])})"
+        if booked and action != "on":
+            text += f"\n\n⚠️ На эти даты есть записи: {booked}. Свяжитесь с клиентами."
+        await update.message.reply_text(text, reply_markup=back, parse_mode=ParseMode.MARKDOWN)
+        
+        # Newly opened capacity goes to the waitlist first
+        if action != "off":
+            for day in days:
+                if (master_name, day) in waitlist_index or ("*", day) in waitlist_index:
+                    for slot in UltraCalendar(master_name).available_slots(day):
+                        await WaitlistSystem.offer_slot(context, master_name, day, slot)
+    
+    @staticmethod
+    async def show_week(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Week view built from working slots and the slot index"""
+        query = update.callback_query
+        await query.answer()
+        
+        master_name = find_master_name(query.from_user.id)
+        if not master_name:
+            await query.edit_message_text("❌ Вы не зарегистрированы как мастер")
+            return
+        
+        offset = int(query.data.replace("sched_week_", ""))
+        today = clock.today()
+        monday = today - (today - 1) % 7 + offset * 7
+        
+        text = f"🗓 *Неделя {format_date(monday, '%d.%m')} — {format_date(monday + 6, '%d.%m')}*\n\n"
+        for i in range(7):
+            day = monday + i
+            slots = working_slots(master_name, day)
+            marker = "🔵" if day == today else "▫️"
+            text += f"{marker} *{ScheduleSystem.WEEKDAYS[i].upper()} {format_date(day, '%d.%m')}*"
+            if not slots:
+                text += " — выходной\n"
+                continue
+            text += f" {SLOT_TIMES[slots[0]]}–{_minutes_to_time((slots[-1] + 1) * SLOT_MINUTES)}\n"
+            for slot, booking_id in sorted(slot_index.get((master_name, day), {}).items()):
+                text += f"   {SLOT_TIMES[slot]} {bookings[booking_id]['service']}\n"
+        
+        keyboard = [
+            [
+                InlineKeyboardButton("◀️", callback_data=f"sched_week_{offset - 1}"),
+                InlineKeyboardButton("▶️", callback_data=f"sched_week_{offset + 1}")
+            ],
+            [InlineKeyboardButton("✏️ Расписание", callback_data="sched_edit")],
+            [InlineKeyboardButton("⬅️ Назад", callback_data="master_panel")]
+        ]
+        await query.edit_message_text(
+            text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+
+async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Route free text to the flow waiting for it"""
+    session = user_sessions.get(update.effective_user.id, {})
+    awaiting = session.get("awaiting", "")
+    if awaiting.startswith("schedule_"):
+        await ScheduleSystem.handle_input(update, context, awaiting.replace("schedule_", ""))
+    elif awaiting == "client_search":
+        await ClientSystem.handle_search(update, context)
+    elif awaiting.startswith("review_"):
+        await RatingSystem.handle_review_text(update, context, awaiting.replace("review_", "", 1))
+
+
 async def master_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Master panel"""
     query = update.callback_query
@@ -819,34 +3437,31 @@ async def master_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = query.from_user.id
     
-    # Find master name
-    master_name = None
-    for name, info in CONFIG["masters"].items():
-        if info["telegram_id"] == user_id:
-            master_name = name
-            break
-    
+    master_name = find_master_name(user_id)
     if not master_name:
         await query.edit_message_text("❌ Вы не зарегистрированы как мастер")
         return
     
     # Get today's and tomorrow's bookings
-    today = datetime.now().date()
-    tomorrow = today + timedelta(days=1)
+    today = clock.today()
+    tomorrow = today + 1
     
     today_bookings = [
-        b for b in bookings.values()
-        if b["master"] == master_name and b["date"] == str(today) and b["status"] == "confirmed"
+        bookings[booking_id]
+        for _, booking_id in sorted(slot_index.get((master_name, today), {}).items())
     ]
     
     tomorrow_bookings = [
-        b for b in bookings.values()
-        if b["master"] == master_name and b["date"] == str(tomorrow) and b["status"] == "confirmed"
+        bookings[booking_id]
+        for _, booking_id in sorted(slot_index.get((master_name, tomorrow), {}).items())
     ]
     
     panel_text = f"👨‍💼 *Панель мастера {master_name}*\n\n"
-    panel_text += f"📅 *Сегодня ({today}):* {len(today_bookings)} запис(и)\n"
-    panel_text += f"📅 *Завтра ({tomorrow}):* {len(tomorrow_bookings)} запис(и)\n\n"
+    rating = master_rating(master_name)
+    if rating:
+        panel_text += f"⭐ *Рейтинг:* {rating[0]:.1f} ({rating[1]} оценок)\n\n"
+    panel_text += f"📅 *Сегодня ({iso_date(today)}):* {len(today_bookings)} запис(и)\n"
+    panel_text += f"📅 *Завтра ({iso_date(tomorrow)}):* {len(tomorrow_bookings)} запис(и)\n\n"
     
     if today_bookings:
         panel_text += "*Записи на сегодня:*\n"
@@ -854,6 +3469,8 @@ async def master_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             panel_text += f"  • {booking['time']} - {booking['service']} ({booking['price']}₽)\n"
     
     keyboard = [
+        [InlineKeyboardButton("🗓 Неделя", callback_data="sched_week_0")],
+        [InlineKeyboardButton("✏️ Расписание", callback_data="sched_edit")],
         [InlineKeyboardButton("⬅️ Назад", callback_data="show_roles")]
     ]
     
@@ -886,13 +3503,42 @@ async def stub_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # MAIN FUNCTION
 # ========================
 
-def main():
-    """Start the bot"""
-    
-    # Create the Application
-    application = Application.builder().token(CONFIG["token"]).build()
-    
-    # Add handlers
+class StartupProfiler:
+    """Wall-clock timings of startup phases (--profile-startup)"""
+    
+    def __init__(self, origin: float):
+        self.origin = origin
+        self.phases = []  # (name, started, finished, background)
+    
+    @contextmanager
+    def phase(self, name: str, background: bool = False):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, started, perf_counter(), background))
+    
+    def report(self) -> str:
+        """Phase table with offsets from module import start"""
+        lines = ["Startup profile (ms):", f"  {'phase':<28}{'start':>8}{'end':>8}{'took':>8}"]
+        for name, started, finished, background in sorted(self.phases, key=lambda p: p[1]):
+            label = f"{name} [bg]" if background else name
+            lines.append(
+                f"  {label:<28}{(started - self.origin) * 1000:>8.1f}"
+                f"{(finished - self.origin) * 1000:>8.1f}{(finished - started) * 1000:>8.1f}"
+            )
+        ready = max(finished for _, _, finished, _ in self.phases)
+        lines.append(f"  ready after {(ready - self.origin) * 1000:.1f} ms")
+        return "\n".join(lines)
+
+
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Log errors raised by handlers"""
+    logger.error(msg="Exception while handling an update:", exc_info=context.error)
+
+
+def register_handlers(application: Application):
+    """Register all update handlers and background jobs"""
     application.add_handler(CommandHandler("start", start))
     
     # Role selection
@@ -903,36 +3549,151 @@ def main():
     application.add_handler(CallbackQueryHandler(show_client_menu, pattern="^back_to_client$"))
     application.add_handler(CallbackQueryHandler(start_booking, pattern="^start_booking$"))
     application.add_handler(CallbackQueryHandler(handle_service, pattern="^service_"))
-    application.add_handler(CallbackQueryHandler(handle_master, pattern="^master_"))
+    application.add_handler(CallbackQueryHandler(handle_master, pattern="^master_(?!panel$)"))
     application.add_handler(CallbackQueryHandler(handle_calendar, pattern="^date_"))
     application.add_handler(CallbackQueryHandler(handle_time, pattern="^time_"))
     application.add_handler(CallbackQueryHandler(handle_confirmation, pattern="^confirm_"))
     application.add_handler(CallbackQueryHandler(my_bookings, pattern="^my_bookings$"))
     application.add_handler(CallbackQueryHandler(open_webapp, pattern="^open_webapp$"))
     
+    # Booking lifecycle
+    application.add_handler(CallbackQueryHandler(BookingLifecycleSystem.handle_cancel_request, pattern="^cancel_booking_"))
+    application.add_handler(CallbackQueryHandler(BookingLifecycleSystem.handle_cancel_confirm, pattern="^cancel_confirm_"))
+    application.add_handler(CallbackQueryHandler(BookingLifecycleSystem.handle_reschedule_request, pattern="^move_booking_"))
+    
+    # Waitlist
+    application.add_handler(CallbackQueryHandler(WaitlistSystem.handle_join, pattern="^wl_join$"))
+    application.add_handler(CallbackQueryHandler(WaitlistSystem.handle_scope, pattern="^wl_scope_"))
+    application.add_handler(CallbackQueryHandler(WaitlistSystem.handle_window, pattern="^wl_window_"))
+    application.add_handler(CallbackQueryHandler(WaitlistSystem.handle_leave, pattern="^wl_leave_"))
+    application.add_handler(CallbackQueryHandler(WaitlistSystem.handle_accept, pattern="^wl_accept_"))
+    application.add_handler(CallbackQueryHandler(WaitlistSystem.handle_decline, pattern="^wl_decline_"))
+    
+    # Client profiles
+    application.add_handler(CallbackQueryHandler(ClientSystem.rebook, pattern="^rebook$"))
+    application.add_handler(CallbackQueryHandler(ClientSystem.request_phone, pattern="^share_phone$"))
+    application.add_handler(MessageHandler(filters.CONTACT, ClientSystem.handle_contact))
+    
+    # Ratings
+    application.add_handler(CallbackQueryHandler(RatingSystem.handle_rating, pattern="^rate_(.+)_([1-5])$"))
+    application.add_handler(CallbackQueryHandler(RatingSystem.request_review_text, pattern="^review_"))
+    
     # Admin handlers
     application.add_handler(CallbackQueryHandler(admin_panel, pattern="^admin_panel$"))
     application.add_handler(CallbackQueryHandler(admin_masters, pattern="^admin_masters$"))
     application.add_handler(CallbackQueryHandler(admin_settings, pattern="^admin_settings$"))
     application.add_handler(CallbackQueryHandler(admin_analytics, pattern="^admin_analytics$"))
+    application.add_handler(CallbackQueryHandler(AnalyticsSystem.show_range, pattern="^analytics_range_"))
+    application.add_handler(CallbackQueryHandler(AnalyticsSystem.show_heatmap, pattern="^analytics_heatmap_"))
+    application.add_handler(CallbackQueryHandler(ExportSystem.show_export_menu, pattern="^admin_export$"))
+    application.add_handler(CallbackQueryHandler(ExportSystem.show_format_menu, pattern="^export_period_"))
+    application.add_handler(CallbackQueryHandler(ExportSystem.run_export, pattern="^export_run_"))
+    application.add_handler(CallbackQueryHandler(ClientSystem.request_search, pattern="^admin_clients$"))
+    application.add_handler(CallbackQueryHandler(ClientSystem.show_profile, pattern="^admin_client_"))
     
     # Master handlers
     application.add_handler(CallbackQueryHandler(master_panel, pattern="^master_panel$"))
+    application.add_handler(CallbackQueryHandler(ScheduleSystem.show_editor, pattern="^sched_edit$"))
+    application.add_handler(CallbackQueryHandler(ScheduleSystem.request_input, pattern="^sched_input_"))
+    application.add_handler(CallbackQueryHandler(ScheduleSystem.show_week, pattern="^sched_week_"))
+    
+    # Free text input (schedule editor etc.)
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_input))
     
     # Stub handlers
     application.add_handler(CallbackQueryHandler(stub_handler, pattern="^(add_master|edit_settings)$"))
     
     # Error handler
-    async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
-        logger.error(msg="Exception while handling an update:", exc_info=context.error)
-    
     application.add_error_handler(error_handler)
     
+    # Past bookings move to the columnar archive every night
+    archive_hour, archive_minute = map(int, CONFIG["storage"]["archive_time"].split(":"))
+    application.job_queue.run_daily(
+        archive_job,
+        time=dt_time(archive_hour, archive_minute, tzinfo=clock.tz)
+    )
+    # Catch up on nights missed while the bot was down
+    application.job_queue.run_once(archive_job, when=0)
+    
+    # Morning agenda for masters
+    digest_hour, digest_minute = map(int, CONFIG["notifications"]["digest_time"].split(":"))
+    application.job_queue.run_daily(
+        NotificationSystem.digest_job,
+        time=dt_time(digest_hour, digest_minute, tzinfo=clock.tz)
+    )
+    
+    # Rating prompts after finished visits
+    application.job_queue.run_repeating(
+        RatingSystem.prompt_job,
+        interval=CONFIG["ratings"]["check_interval"],
+        first=CONFIG["ratings"]["check_interval"]
+    )
+    
+    # Periodic snapshots keep journal replay short
+    application.job_queue.run_repeating(
+        snapshot_job,
+        interval=CONFIG["storage"]["snapshot_interval"],
+        first=CONFIG["storage"]["snapshot_interval"]
+    )
+
+
+def main():
+    """Start the bot"""
+    main_started = perf_counter()
+    parser = argparse.ArgumentParser(description=f"{CONFIG['salon_name']} booking bot")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="log time spent in each startup phase")
+    parser.add_argument("--simulate", type=int, metavar="USERS",
+                        help="run a seeded load simulation with USERS virtual clients and exit")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="random seed for --simulate (default: 1)")
+    args = parser.parse_args()
+    
+    if args.simulate:
+        # Test fakes stay out of normal startup
+        from simulation import run_simulation
+        raise SystemExit(0 if run_simulation(args.simulate, args.seed) else 1)
+    
+    profiler = StartupProfiler(_MODULE_IMPORT_STARTED)
+    profiler.phases.append(("imports", _MODULE_IMPORT_STARTED, main_started, False))
+    
+    # Restore bookings from snapshot + journal in the background while
+    # the Application is built and connects to Telegram
+    def warm_up():
+        with profiler.phase("restore + index warm-up", background=True):
+            restore_state()
+    
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warm-up")
+    restored = executor.submit(warm_up)
+    
+    async def post_init(application: Application):
+        # Runs after getMe; no updates are processed before state is restored
+        profiler.phases.append(("connect to Telegram", connect_started, perf_counter(), False))
+        with profiler.phase("wait for warm-up"):
+            await asyncio.wrap_future(restored)
+        executor.shutdown(wait=False)
+        if args.profile_startup:
+            logger.info(profiler.report())
+    
+    with profiler.phase("build application"):
+        application = Application.builder().token(CONFIG["token"]).post_init(post_init).build()
+    
+    with profiler.phase("register handlers"):
+        register_handlers(application)
+    
     # Start the bot
     logger.info("✅ БОТ УСПЕШНО ЗАПУЩЕН! 📱")
     logger.info("КОМАНДЫ: /start")
     
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    connect_started = perf_counter()
+    try:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    finally:
+        if restored.done() and restored.exception() is None:
+            try:
+                save_snapshot()
+            finally:
+                journal.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,333 @@
+"""
+Seeded load simulation of concurrent booking flows (python salon_bot.py --simulate)
+
+Drives the real handlers of salon_bot through fake Telegram objects and
+checks that derived state still matches the bookings afterwards.
+"""
+
+import asyncio
+import hashlib
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from time import perf_counter
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from telegram import InlineKeyboardMarkup
+from telegram.ext import CallbackQueryHandler
+
+import salon_bot as bot
+
+
+def inline_buttons(markup) -> List[str]:
+    """Callback data of all inline buttons in a reply markup"""
+    if not isinstance(markup, InlineKeyboardMarkup):
+        return []
+    return [button.callback_data for row in markup.inline_keyboard for button in row if button.callback_data]
+
+
+class FakeJob:
+    """Scheduled callback of FakeJobQueue"""
+    
+    def __init__(self, callback, due: datetime, data, name: str):
+        self.callback = callback
+        self.due = due
+        self.data = data
+        self.name = name
+        self.removed = False
+    
+    def schedule_removal(self):
+        self.removed = True
+
+
+class FakeJobQueue:
+    """JobQueue stand-in: one-off jobs run on the simulated clock, recurring ones are ignored"""
+    
+    def __init__(self):
+        self.jobs: List[FakeJob] = []
+    
+    def run_once(self, callback, when: float, data=None, name: str = None, **kwargs) -> FakeJob:
+        job = FakeJob(callback, bot.clock.now() + timedelta(seconds=when), data, name)
+        self.jobs.append(job)
+        return job
+    
+    def run_daily(self, callback, time, **kwargs):
+        pass
+    
+    def run_repeating(self, callback, interval, first=None, **kwargs):
+        pass
+    
+    def get_jobs_by_name(self, name: str) -> List[FakeJob]:
+        return [job for job in self.jobs if job.name == name and not job.removed]
+    
+    def next_due(self) -> Optional[datetime]:
+        """Due time of the earliest pending job"""
+        self.jobs = [job for job in self.jobs if not job.removed]
+        return min((job.due for job in self.jobs), default=None)
+    
+    def pop_due(self) -> List[FakeJob]:
+        """Take jobs that are due now, oldest first"""
+        now = bot.clock.now()
+        due = sorted((job for job in self.jobs if not job.removed and job.due <= now), key=lambda j: j.due)
+        for job in due:
+            job.removed = True
+        return due
+
+
+class FakeQuery:
+    """CallbackQuery stand-in that records the screen shown to the user"""
+    
+    def __init__(self, sim: "Simulation", user_id: int, data: str):
+        self.sim = sim
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id, first_name=f"User{user_id}", last_name=None)
+        self.message = SimpleNamespace(chat_id=user_id, reply_text=self.edit_message_text)
+    
+    async def answer(self, *args, **kwargs):
+        await self.sim.idle()
+    
+    async def edit_message_text(self, text: str, reply_markup=None, **kwargs):
+        await self.sim.idle()
+        self.sim.screens[self.from_user.id] = (text, inline_buttons(reply_markup))
+
+
+class FakeBot:
+    """Bot API stand-in; waitlist offers are answered by the simulated client"""
+    
+    def __init__(self, sim: "Simulation"):
+        self.sim = sim
+    
+    async def send_message(self, chat_id: int, text: str, reply_markup=None, **kwargs):
+        await self.sim.idle()
+        self.sim.counters["messages sent"] += 1
+        buttons = inline_buttons(reply_markup)
+        if any(data.startswith("wl_accept_") for data in buttons):
+            self.sim.spawn(self.sim.answer_offer(chat_id, buttons))
+
+
+class Simulation:
+    """Seeded load simulation of concurrent clients against the real handlers (--simulate)
+
+    Every fake Telegram call yields to the event loop a seeded-random
+    number of times, so one seed is one reproducible interleaving. Time
+    comes from a FixedClock and the journal is never opened, so disk I/O
+    does not perturb the schedule.
+    """
+    
+    START = datetime(2030, 1, 7, 8, 0)  # Monday morning
+    
+    def __init__(self, users: int, seed: int):
+        self.users = users
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.bot = FakeBot(self)
+        self.job_queue = FakeJobQueue()
+        self.context = SimpleNamespace(bot=self.bot, job_queue=self.job_queue, job=None)
+        self.screens: Dict = {}    # user_id -> (text, [callback_data]) of the last screen
+        self.tasks: List = []
+        self.counters = Counter()
+        self.errors = Counter()
+        
+        # Route callbacks exactly like the real Application would
+        handlers = []
+        bot.register_handlers(SimpleNamespace(
+            add_handler=handlers.append,
+            add_error_handler=lambda callback: None,
+            job_queue=self.job_queue
+        ))
+        self.handlers = [h for h in handlers if isinstance(h, CallbackQueryHandler)]
+    
+    async def idle(self):
+        """Yield to other coroutines a random number of times"""
+        for _ in range(self.rng.randrange(4)):
+            await asyncio.sleep(0)
+    
+    def spawn(self, coroutine):
+        self.tasks.append(asyncio.ensure_future(coroutine))
+    
+    async def click(self, user_id: int, data: str) -> tuple:
+        """Press an inline button; returns the resulting (text, buttons)"""
+        handler = next((h for h in self.handlers if h.pattern.match(data)), None)
+        if handler is None:
+            self.errors[f"no handler for {data}"] += 1
+            return "", []
+        query = FakeQuery(self, user_id, data)
+        update = SimpleNamespace(
+            callback_query=query, effective_user=query.from_user,
+            effective_chat=SimpleNamespace(id=user_id), message=None
+        )
+        self.counters["actions"] += 1
+        bot.clock.advance(milliseconds=self.rng.randrange(500))
+        try:
+            await handler.callback(update, self.context)
+        except Exception as e:
+            self.errors[f"{handler.callback.__qualname__}: {type(e).__name__}: {e}"] += 1
+        await self.run_due_jobs()
+        return self.screens.get(user_id, ("", []))
+    
+    async def run_due_jobs(self):
+        for job in self.job_queue.pop_due():
+            try:
+                await job.callback(SimpleNamespace(bot=self.bot, job_queue=self.job_queue, job=job))
+            except Exception as e:
+                self.errors[f"{job.callback.__qualname__}: {type(e).__name__}: {e}"] += 1
+    
+    @staticmethod
+    def matching(buttons: List[str], prefix: str) -> List[str]:
+        return [data for data in buttons if data.startswith(prefix)]
+    
+    async def pick_slot(self, user_id: int, buttons: List[str]) -> tuple:
+        """Choose a date (nearest ones are most popular) and a time; None if nothing free"""
+        dates = self.matching(buttons, "date_")
+        if not dates:
+            return None
+        text, buttons = await self.click(user_id, dates[min(int(self.rng.expovariate(0.5)), len(dates) - 1)])
+        times = self.matching(buttons, "time_")
+        if not times:
+            return None
+        return await self.click(user_id, self.rng.choice(times))
+    
+    async def confirm(self, user_id: int) -> str:
+        """Press "Yes", sometimes twice in a row like an impatient client"""
+        if self.rng.random() < 0.05:
+            await asyncio.gather(self.click(user_id, "confirm_yes"), self.click(user_id, "confirm_yes"))
+            return self.screens[user_id][0]
+        text, _ = await self.click(user_id, "confirm_yes")
+        return text
+    
+    async def virtual_user(self, user_id: int):
+        """One client: book (retrying on conflicts), then maybe cancel or move"""
+        rng = self.rng
+        await self.idle()
+        _, buttons = await self.click(user_id, "start_booking")
+        _, buttons = await self.click(user_id, rng.choice(self.matching(buttons, "service_")))
+        _, buttons = await self.click(user_id, rng.choice(self.matching(buttons, "master_")))
+        
+        for _ in range(3):
+            if await self.pick_slot(user_id, buttons) is None:
+                if rng.random() < 0.5 and "wl_join" in self.screens[user_id][1]:
+                    await self.click(user_id, "wl_join")
+                    await self.click(user_id, rng.choice(["wl_scope_master", "wl_scope_any"]))
+                    await self.click(user_id, "wl_window_any")
+                    self.counters["waitlist joins"] += 1
+                break
+            if rng.random() < 0.1:
+                await self.click(user_id, "confirm_no")
+                break
+            text = await self.confirm(user_id)
+            if "уже недоступно" not in text:
+                break
+            self.counters["conflicts"] += 1
+            buttons = self.screens[user_id][1]
+        
+        _, buttons = await self.click(user_id, "my_bookings")
+        roll = rng.random()
+        if roll < 0.2 and self.matching(buttons, "cancel_booking_"):
+            _, buttons = await self.click(user_id, rng.choice(self.matching(buttons, "cancel_booking_")))
+            await self.click(user_id, self.matching(buttons, "cancel_confirm_")[0])
+        elif roll < 0.35 and self.matching(buttons, "move_booking_"):
+            _, buttons = await self.click(user_id, rng.choice(self.matching(buttons, "move_booking_")))
+            if await self.pick_slot(user_id, buttons) is not None:
+                await self.confirm(user_id)
+        await self.click(user_id, "back_to_client")
+    
+    async def answer_offer(self, user_id: int, buttons: List[str]):
+        """Client reacts to a waitlist offer after a while"""
+        await self.idle()
+        self.counters["waitlist offers"] += 1
+        prefix = "wl_accept_" if self.rng.random() < 0.7 else "wl_decline_"
+        await self.click(user_id, self.matching(buttons, prefix)[0])
+    
+    async def run(self) -> float:
+        """Run all users to completion, then drain timers; returns elapsed seconds"""
+        started = perf_counter()
+        for user_id in range(1, self.users + 1):
+            self.spawn(self.virtual_user(user_id))
+        while True:
+            while not all(task.done() for task in self.tasks):
+                await asyncio.gather(*self.tasks)
+            # Nobody is clicking any more: jump to the next timer (hold expiry, notifications)
+            due = self.job_queue.next_due()
+            if due is None:
+                break
+            bot.clock.advance(seconds=max(0.0, (due - bot.clock.now()).total_seconds()))
+            await self.run_due_jobs()
+        return perf_counter() - started
+    
+    def check_invariants(self) -> List[str]:
+        """Cross-check derived state against the bookings themselves"""
+        problems = []
+        slots, stats, per_user = {}, {}, {}
+        total_bookings = total_revenue = 0
+        for booking in bot.bookings.values():
+            per_user.setdefault(booking["user_id"], set()).add(booking["id"])
+            if booking["status"] != "confirmed":
+                continue
+            day_slots = slots.setdefault((booking["master"], bot.parse_date(booking["date"])), {})
+            slot = bot.parse_time(booking["time"])
+            if slot in day_slots:
+                problems.append(f"double booking: {booking['master']} {booking['date']} {booking['time']}")
+            day_slots[slot] = booking["id"]
+            master_totals = stats.setdefault(booking["master"], {"bookings": 0, "revenue": 0})
+            master_totals["bookings"] += 1
+            master_totals["revenue"] += booking["price"]
+            total_bookings += 1
+            total_revenue += booking["price"]
+        
+        if slots != bot.slot_index:
+            problems.append("slot index does not match bookings")
+        if stats != {name: s for name, s in bot.master_stats.items() if s["bookings"]}:
+            problems.append(f"master stats {bot.master_stats} != {stats}")
+        if (bot.analytics_data.get("total_bookings", 0), bot.analytics_data.get("total_revenue", 0)) != (total_bookings, total_revenue):
+            problems.append("analytics totals do not match bookings")
+        if per_user != {user_id: ids for user_id, ids in bot.user_bookings_index.items() if ids}:
+            problems.append("per-user index does not match bookings")
+        per_user_waitlist = {}
+        for entry in bot.waitlist.values():
+            per_user_waitlist.setdefault(entry["user_id"], set()).add(entry["id"])
+        if per_user_waitlist != bot.user_waitlist_index:
+            problems.append("per-user waitlist index does not match waitlist")
+        leaked = [user_id for user_id, session in bot.user_sessions.items() if session]
+        if leaked:
+            problems.append(f"{len(leaked)} sessions left open, e.g. {leaked[0]}: {bot.user_sessions[leaked[0]]}")
+        if bot.holds or bot.slot_holds:
+            problems.append(f"{len(bot.holds)} waitlist holds left after all offers expired")
+        if bot.pending_notifications:
+            problems.append(f"{len(bot.pending_notifications)} masters with unsent notifications")
+        return problems
+    
+    def fingerprint(self) -> str:
+        """Digest of final bookings: equal seeds must give equal fingerprints"""
+        rows = sorted(
+            (b["id"], b["user_id"], b["master"], b["date"], b["time"], b["status"])
+            for b in bot.bookings.values()
+        )
+        return hashlib.sha1(repr(rows).encode()).hexdigest()[:12]
+
+
+def run_simulation(users: int, seed: int) -> bool:
+    """Run --simulate and log a report; returns False on errors or broken invariants"""
+    bot.set_clock(bot.FixedClock(bot.CONFIG["salon_info"]["timezone"], Simulation.START))
+    sim = Simulation(users, seed)
+    elapsed = asyncio.run(sim.run())
+    problems = sim.check_invariants()
+    
+    confirmed = sum(1 for b in bot.bookings.values() if b["status"] == "confirmed")
+    actions = sim.counters["actions"]
+    report = [
+        f"Simulation: {users} users, seed {seed}",
+        f"  {'actions':<18}{actions} ({actions / elapsed:.0f}/s)",
+        f"  {'bookings':<18}{confirmed} confirmed, {len(bot.bookings) - confirmed} cancelled ({confirmed / elapsed:.0f}/s)",
+    ]
+    for name in ("conflicts", "waitlist joins", "waitlist offers", "messages sent"):
+        report.append(f"  {name:<18}{sim.counters[name]}")
+    report.append(f"  {'elapsed':<18}{elapsed:.2f}s")
+    report.append(f"  {'fingerprint':<18}{sim.fingerprint()}")
+    for error, count in sim.errors.most_common():
+        report.append(f"  ERROR x{count}: {error}")
+    for problem in problems:
+        report.append(f"  INVARIANT: {problem}")
+    report.append("  OK" if not problems and not sim.errors else "  FAILED")
+    bot.logger.info("\n".join(report))
+    return not problems and not sim.errors
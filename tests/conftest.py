@@ -0,0 +1,95 @@
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import salon_bot  # noqa: E402
+from simulation import FakeJobQueue  # noqa: E402
+
+STATE = (
+    "bookings", "client_data", "user_sessions", "master_stats", "master_schedules",
+    "analytics_data", "user_roles", "slot_index", "user_bookings_index", "waitlist",
+    "waitlist_index", "user_waitlist_index", "slot_holds", "holds", "phone_index", "reviews",
+    "pending_ratings", "master_ratings", "availability_cache", "pending_notifications",
+)
+
+
+def reset(bot, tmp_path, monkeypatch):
+    """Empty in-memory state with storage under tmp_path"""
+    for name in STATE:
+        monkeypatch.setattr(bot, name, {})
+    monkeypatch.setattr(bot, "client_search_index", [])
+    monkeypatch.setattr(bot, "journal", bot.BookingJournal(str(tmp_path), fsync_window=0))
+    monkeypatch.setattr(bot, "archive", bot.BookingArchive(str(tmp_path / "archive")))
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    """salon_bot with empty state, storage under tmp_path and a fixed clock"""
+    reset(salon_bot, tmp_path, monkeypatch)
+    monkeypatch.setattr(salon_bot, "clock", salon_bot.FixedClock(
+        salon_bot.CONFIG["salon_info"]["timezone"], datetime(2026, 3, 2, 9, 0)))
+    yield salon_bot
+    salon_bot.journal.close()
+
+
+def restart(bot, tmp_path, monkeypatch):
+    """Simulate a process restart: drop in-memory state and restore from disk"""
+    bot.journal.close()
+    reset(bot, tmp_path, monkeypatch)
+    bot.restore_state()
+
+
+@pytest.fixture(params=["numpy", "python"])
+def numpy_mode(request, monkeypatch):
+    """Run a test with vectorized archive code and with the pure-Python fallback"""
+    if request.param == "numpy":
+        numpy = pytest.importorskip("numpy")
+        monkeypatch.setattr(salon_bot, "_numpy", numpy)
+    else:
+        monkeypatch.setattr(salon_bot, "_numpy", False)
+    return request.param
+
+
+class Query:
+    """CallbackQuery stub that keeps the last text shown"""
+
+    def __init__(self, user_id, data):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id, first_name=f"User{user_id}", last_name=None)
+        self.message = SimpleNamespace(chat_id=user_id, reply_text=self.edit_message_text)
+        self.text = None
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        self.text = text
+
+
+class Bot:
+    """Bot API stub that records sent messages"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+def make_context():
+    return SimpleNamespace(bot=Bot(), job_queue=FakeJobQueue(), job=None)
+
+
+def click(handler, user_id, data, context=None):
+    """Run a callback handler for one button press; returns the query"""
+    query = Query(user_id, data)
+    update = SimpleNamespace(callback_query=query, effective_user=query.from_user,
+                             effective_chat=SimpleNamespace(id=user_id), message=None)
+    asyncio.run(handler(update, context or make_context()))
+    return query
@@ -0,0 +1,115 @@
+import json
+import os
+import random
+
+from conftest import restart
+
+MASTERS = ("Дмитрий", "Александр")
+SERVICES = {"Женская стрижка": 500, "Мужская стрижка": 400, "Бритье": 300}
+
+
+def past_bookings(bot, count, seed=1):
+    rng = random.Random(seed)
+    start = bot.clock.today() - 60
+    result = []
+    for i in range(count):
+        service = rng.choice(list(SERVICES))
+        result.append({
+            "id": f"b{i}", "user_id": rng.randrange(20), "service": service,
+            "master": rng.choice(MASTERS), "date": bot.iso_date(start + rng.randrange(60)),
+            "time": bot.SLOT_TIMES[rng.randrange(16, 36)], "price": SERVICES[service],
+            "status": rng.choice(("confirmed", "confirmed", "cancelled")),
+            "created_at": "2026-01-01T10:00:00",
+        })
+    return result
+
+
+def expected_totals(rows, key):
+    totals = {}
+    for row in rows:
+        if row["status"] == "confirmed":
+            count, revenue = totals.get(row[key], (0, 0))
+            totals[row[key]] = (count + 1, revenue + row["price"])
+    return totals
+
+
+def test_append_and_load(bot, tmp_path):
+    rows = past_bookings(bot, 300)
+    middle = bot.iso_date(bot.clock.today() - 30)
+    # One nightly append per date range, like archive_past_bookings
+    bot.archive.append_bookings([r for r in rows if r["date"] < middle], middle)
+    cutoff = bot.iso_date(bot.clock.today())
+    bot.archive.append_bookings([r for r in rows if r["date"] >= middle], cutoff)
+
+    loaded = bot.BookingArchive(str(tmp_path / "archive"))
+    loaded.load()
+
+    assert len(loaded) == 300 and loaded.cutoff == cutoff
+    assert loaded.master_totals == {name: list(t) for name, t in expected_totals(rows, "master").items()}
+    decoded = [row for chunk in loaded.iter_chunks(chunk_size=64) for row in chunk]
+    assert decoded == sorted(
+        ((r["date"], r["time"], r["master"], r["service"], r["price"], r["status"], r["user_id"])
+         for r in rows), key=lambda r: (r[0], r[1]))
+
+
+def test_load_truncates_interrupted_append(bot, tmp_path):
+    bot.archive.append_bookings(past_bookings(bot, 50), bot.iso_date(bot.clock.today()))
+    directory = tmp_path / "archive"
+    # Columns written, process died before meta.json was replaced
+    for name in ("date", "price"):
+        with open(directory / f"{name}.bin", "ab") as f:
+            f.write(b"\x01" * 12)
+
+    loaded = bot.BookingArchive(str(directory))
+    loaded.load()
+
+    assert all(len(column) == 50 for column in loaded.columns.values())
+    for name, column in loaded.columns.items():
+        assert os.path.getsize(directory / f"{name}.bin") == 50 * column.itemsize
+
+
+def test_load_derives_totals_missing_from_old_meta(bot, tmp_path):
+    rows = past_bookings(bot, 80)
+    bot.archive.append_bookings(rows, bot.iso_date(bot.clock.today()))
+    meta_path = tmp_path / "archive" / "meta.json"
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    del meta["master_totals"]
+    meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    loaded = bot.BookingArchive(str(tmp_path / "archive"))
+    loaded.load()
+
+    assert loaded.master_totals == {name: list(t) for name, t in expected_totals(rows, "master").items()}
+
+
+def test_group_totals_and_heatmap(bot, numpy_mode):
+    rows = past_bookings(bot, 500)
+    bot.archive.append_bookings(rows, bot.iso_date(bot.clock.today()))
+    start = bot.clock.today() - 30
+    recent = [r for r in rows if bot.parse_date(r["date"]) >= start]
+
+    assert bot.archive.group_totals("master") == expected_totals(rows, "master")
+    assert bot.archive.group_totals("service", start) == expected_totals(recent, "service")
+
+    grid = [[0] * bot.SLOTS_PER_DAY for _ in range(7)]
+    for row in recent:
+        if row["status"] == "confirmed":
+            grid[(bot.parse_date(row["date"]) - 1) % 7][bot.parse_time(row["time"])] += 1
+    assert bot.archive.heatmap(start) == grid
+
+
+def test_restore_drops_archived_bookings_without_numpy(bot, tmp_path, monkeypatch):
+    bot.restore_state()
+    today = bot.clock.today()
+    old = bot.create_booking(1, "Бритье", "Дмитрий", today - 1, 20)
+    live = bot.create_booking(2, "Бритье", "Дмитрий", today, 30)
+    # Archived, but the process stopped before the next snapshot
+    bot.archive.append_bookings([old], bot.iso_date(today))
+
+    monkeypatch.setattr(bot, "_numpy", None)
+    restart(bot, tmp_path, monkeypatch)
+
+    assert list(bot.bookings) == [live["id"]]
+    assert bot.master_stats == {"Дмитрий": {"bookings": 2, "revenue": 600}}
+    assert bot.analytics_data["total_bookings"] == 2
+    assert bot._numpy is None  # Startup did not import NumPy
@@ -0,0 +1,78 @@
+from datetime import date
+
+from conftest import click, restart
+
+MASTER = "Дмитрий"
+SERVICE = "Мужская стрижка"
+
+
+def ddmm(day):
+    return date.fromordinal(day).strftime("%d.%m")
+
+
+def assert_derived_state(bot, slots):
+    """slot_index, master_stats and analytics_data match `slots`: {(day, slot): booking}"""
+    expected_index = {}
+    for (day, slot), booking in slots.items():
+        expected_index.setdefault((MASTER, day), {})[slot] = booking["id"]
+    revenue = sum(booking["price"] for booking in slots.values())
+    assert {key: value for key, value in bot.slot_index.items() if value} == expected_index
+    assert bot.master_stats[MASTER] == {"bookings": len(slots), "revenue": revenue}
+    assert bot.analytics_data["total_bookings"] == len(slots)
+    assert bot.analytics_data["total_revenue"] == revenue
+
+
+def test_cancel_and_move_keep_derived_state(bot, tmp_path, monkeypatch):
+    bot.restore_state()
+    day = bot.clock.today() + 1
+    first = bot.create_booking(1, SERVICE, MASTER, day, 20)
+    second = bot.create_booking(2, SERVICE, MASTER, day, 22)
+
+    assert bot.cancel_booking(first["id"])["status"] == "cancelled"
+    moved = bot.reschedule_booking(second["id"], day + 1, 26)
+    assert moved["time"] == "13:00"
+    assert_derived_state(bot, {(day + 1, 26): moved})
+
+    restart(bot, tmp_path, monkeypatch)
+    assert_derived_state(bot, {(day + 1, 26): moved})
+    assert bot.bookings[first["id"]]["status"] == "cancelled"
+
+
+def test_move_rejects_unavailable_slots(bot):
+    today = bot.clock.today()  # Monday 09:00
+    booking = bot.create_booking(1, SERVICE, MASTER, today + 1, 20)
+    bot.ScheduleSystem.apply_change(MASTER, "off", ddmm(today + 2), date.fromordinal(today))
+    bot.ScheduleSystem.apply_change(MASTER, "shift", f"{ddmm(today + 3)} 10:00-12:00",
+                                    date.fromordinal(today))
+
+    assert bot.reschedule_booking(booking["id"], today + 2, 20) is None  # Vacation
+    assert bot.reschedule_booking(booking["id"], today + 3, 30) is None  # After the new shift
+    assert bot.reschedule_booking(booking["id"], today + 1, 24) is None  # Lunch
+    assert bot.reschedule_booking(booking["id"], today, 17) is None      # Already past
+    assert bot.reschedule_booking(booking["id"], today - 1, 20) is None
+    assert bot.bookings[booking["id"]] == booking
+    assert bot.reschedule_booking(booking["id"], today + 3, 21)["time"] == "10:30"
+
+
+def test_confirmation_rejects_slot_closed_meanwhile(bot):
+    today = bot.clock.today()
+    bot.user_sessions[1] = {"service": SERVICE, "master": MASTER, "date": today + 2, "time": 20}
+    bot.ScheduleSystem.apply_change(MASTER, "off", ddmm(today + 2), date.fromordinal(today))
+
+    query = click(bot.handle_confirmation, 1, "confirm_yes")
+
+    assert "уже недоступно" in query.text
+    assert not bot.bookings
+
+
+def test_reschedule_confirmation_rejects_slot_closed_meanwhile(bot):
+    today = bot.clock.today()
+    booking = bot.create_booking(1, SERVICE, MASTER, today + 1, 20)
+    bot.user_sessions[1] = {"service": SERVICE, "master": MASTER, "date": today + 2, "time": 20,
+                            "reschedule": booking["id"]}
+    bot.ScheduleSystem.apply_change(MASTER, "off", ddmm(today + 2), date.fromordinal(today))
+
+    query = click(bot.handle_confirmation, 1, "confirm_yes")
+
+    assert "Не удалось перенести" in query.text
+    assert bot.bookings[booking["id"]] == booking
@@ -0,0 +1,40 @@
+from conftest import click
+
+
+def test_profile_escapes_markdown_in_names(bot):
+    bot.record_client(42, first_name="_*Ann*_", last_name="[Lee]")
+    query = click(bot.ClientSystem.show_profile, bot.CONFIG["admin_id"], "admin_client_42")
+
+    assert "\\_\\*Ann\\*\\_ \\[Lee]" in query.text
+
+
+def test_profile_lists_archived_visits(bot, numpy_mode):
+    bot.record_client(42, first_name="Ann", last_name=None)
+    today = bot.clock.today()
+    visit = bot.create_booking(42, "Мужская стрижка", "Дмитрий", today, 20)
+    upcoming = bot.create_booking(42, "Бритье", "Дмитрий", today + 3, 20)
+    bot.create_booking(7, "Мужская стрижка", "Дмитрий", today, 22)
+    bot.clock.advance(days=1)
+    assert bot.archive_past_bookings() == 2
+
+    query = click(bot.ClientSystem.show_profile, bot.CONFIG["admin_id"], "admin_client_42")
+
+    visit_line = f"{bot.format_date(bot.parse_date(visit['date']))} 10:00 — Мужская стрижка, Дмитрий"
+    assert "*Прошедшие визиты:*" in query.text
+    assert visit_line in query.text
+    assert query.text.count("Мужская стрижка") == 1  # Other clients' visits are not shown
+    assert f"{upcoming['time']} — Бритье" in query.text
+
+
+def test_archive_user_rows_newest_first(bot, numpy_mode):
+    rows = [
+        {"date": f"2026-01-0{day}", "time": "10:00", "master": "Дмитрий", "service": "Мужская стрижка",
+         "price": 1000, "status": "confirmed", "user_id": user_id}
+        for day, user_id in ((1, 5), (2, 6), (3, 5), (4, 5))
+    ]
+    bot.archive.append_bookings(rows, "2026-01-05")
+
+    found = bot.archive.user_rows(5, 2)
+
+    assert [row[0] for row in found] == ["2026-01-04", "2026-01-03"]
+    assert bot.archive.user_rows(9, 10) == []
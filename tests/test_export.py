@@ -0,0 +1,48 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+
+
+def add_bookings(bot, count):
+    day = bot.iso_date(bot.clock.today() + 1)
+    for i in range(count):
+        bot.bookings[f"b{i}"] = {
+            "id": f"b{i}", "user_id": i, "service": "Стрижка", "master": "Анна",
+            "date": day, "time": "10:00", "price": 1000, "status": "confirmed",
+            "created_at": "2026-03-01T10:00:00",
+        }
+
+
+def export(bot, fmt):
+    parts = []
+    revenue = io.BytesIO()
+    total = asyncio.run(bot.ExportSystem.write_export(parts, io.BytesIO, revenue, None, None, fmt))
+    return total, [gzip.decompress(part.getvalue()) for part in parts], parts, revenue.getvalue()
+
+
+def test_export_is_gzipped_with_revenue(bot):
+    add_bookings(bot, 3)
+
+    total, (data,), _, revenue = export(bot, "csv")
+
+    assert total == 3
+    rows = list(csv.reader(io.StringIO(data.decode("utf-8-sig"))))
+    assert rows[0] == list(bot.ExportSystem.FIELDS)
+    assert [row[0] for row in rows[1:]] == ["b0", "b1", "b2"]
+    assert revenue.decode("utf-8-sig").splitlines()[1] == "Анна,3,3000"
+
+
+def test_export_split_into_parts_under_limit(bot, monkeypatch):
+    monkeypatch.setattr(bot.ExportSystem, "CHUNK_SIZE", 100)
+    monkeypatch.setattr(bot.ExportSystem, "PART_MAX_SIZE", 4096)
+    add_bookings(bot, 2000)
+
+    total, decoded, parts, _ = export(bot, "ndjson")
+
+    assert total == 2000
+    assert len(parts) > 1
+    assert all(len(part.getvalue()) <= 4096 for part in parts)
+    ids = [json.loads(line)["id"] for data in decoded for line in data.splitlines()]
+    assert ids == [f"b{i}" for i in range(2000)]
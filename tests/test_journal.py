@@ -0,0 +1,131 @@
+import asyncio
+import os
+import threading
+
+from conftest import restart
+
+
+def book(bot, user_id, slot):
+    master = next(iter(bot.CONFIG["masters"]))
+    service = next(iter(bot.CONFIG["services"]))
+    return bot.create_booking(user_id, service, master, bot.clock.today() + 1, slot)
+
+
+def test_restore_replays_journal(bot, tmp_path, monkeypatch):
+    bot.restore_state()
+    first = book(bot, 1, 20)
+
+    restart(bot, tmp_path, monkeypatch)
+
+    assert bot.bookings[first["id"]] == first
+    assert bot.journal.seq == 1
+
+
+def test_torn_tail_is_cut_before_new_records(bot, tmp_path, monkeypatch):
+    bot.restore_state()
+    first = book(bot, 1, 20)
+    bot.journal.close()
+    # Crash in the middle of writing the next record
+    with open(bot.journal.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"s":2,"op":"book","b":["booking_')
+
+    restart(bot, tmp_path, monkeypatch)
+    assert list(bot.bookings) == [first["id"]]
+    assert bot.journal.seq == 1
+    second = book(bot, 2, 22)
+
+    restart(bot, tmp_path, monkeypatch)
+    assert bot.bookings[first["id"]] == first
+    assert bot.bookings[second["id"]] == second
+    assert second["id"] != first["id"]
+    assert bot.journal.seq == 2
+
+
+def test_seq_survives_snapshot_and_torn_tail(bot, tmp_path, monkeypatch):
+    bot.restore_state()
+    book(bot, 1, 20)
+    bot.save_snapshot()
+    book(bot, 2, 22)
+    bot.journal.close()
+    with open(bot.journal.journal_path, "ab") as f:
+        f.write(b'{"s":3,"op"')
+
+    restart(bot, tmp_path, monkeypatch)
+    assert len(bot.bookings) == 2
+    third = book(bot, 3, 24)
+    assert third["id"].endswith("_3")
+
+    restart(bot, tmp_path, monkeypatch)
+    assert len(bot.bookings) == 3
+
+
+def test_background_snapshot_keeps_records_written_meanwhile(bot, tmp_path, monkeypatch):
+    bot.restore_state()
+    first = book(bot, 1, 20)
+
+    async def snapshot_while_booking():
+        task = asyncio.ensure_future(bot.save_snapshot_in_background())
+        await asyncio.sleep(0)  # Rotated; the snapshot is being written in a thread
+        second = book(bot, 2, 22)
+        assert await task
+        return second
+
+    second = asyncio.run(snapshot_while_booking())
+    assert bot.journal.rotated_files() == []
+
+    restart(bot, tmp_path, monkeypatch)
+    assert set(bot.bookings) == {first["id"], second["id"]}
+    assert bot.journal.seq == 2
+
+
+def test_rotated_journal_replayed_when_snapshot_never_written(bot, tmp_path, monkeypatch):
+    bot.restore_state()
+    first = book(bot, 1, 20)
+    bot.journal.rotate()  # Crash before the snapshot reached the disk
+    second = book(bot, 2, 22)
+
+    restart(bot, tmp_path, monkeypatch)
+    assert set(bot.bookings) == {first["id"], second["id"]}
+    bot.save_snapshot()
+    assert bot.journal.rotated_files() == []
+
+    restart(bot, tmp_path, monkeypatch)
+    assert set(bot.bookings) == {first["id"], second["id"]}
+
+
+def test_shutdown_snapshot_waits_for_background_one(bot, tmp_path, monkeypatch):
+    bot.restore_state()
+    first = book(bot, 1, 20)
+    release = threading.Event()
+    build = bot.snapshot_document
+
+    def slow_document(state):
+        release.wait(5)
+        return build(state)
+
+    monkeypatch.setattr(bot, "snapshot_document", slow_document)
+
+    async def start_snapshot():
+        asyncio.ensure_future(bot.save_snapshot_in_background())
+        await asyncio.sleep(0)
+
+    # PTB closes the loop on shutdown while the snapshot thread keeps going
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(start_snapshot())
+    loop.close()
+    second = book(bot, 2, 22)
+    threading.Timer(0.05, release.set).start()
+    bot.save_snapshot()
+
+    assert sorted(os.listdir(tmp_path)) == ["journal.log", "snapshot.json"]
+    restart(bot, tmp_path, monkeypatch)
+    assert set(bot.bookings) == {first["id"], second["id"]}
+    assert bot.journal.snapshot_seq == 2
+
+
+def test_older_snapshot_never_replaces_newer(bot, tmp_path):
+    bot.journal.write_snapshot(5, {"bookings": {}})
+    bot.journal.write_snapshot(3, {"bookings": {}})
+
+    assert bot.journal.load_snapshot()["seq"] == 5
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
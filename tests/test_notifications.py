@@ -0,0 +1,98 @@
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+from conftest import make_context
+
+MASTER = "Дмитрий"
+SERVICE = "Мужская стрижка"
+
+
+def booking(bot, slot, day_offset=1, booking_id="b1"):
+    return {"id": booking_id, "master": MASTER, "service": SERVICE, "status": "confirmed",
+            "date": bot.iso_date(bot.clock.today() + day_offset), "time": bot.SLOT_TIMES[slot]}
+
+
+def run_due_jobs(bot, context):
+    for job in context.job_queue.pop_due():
+        asyncio.run(job.callback(SimpleNamespace(bot=context.bot, job_queue=context.job_queue, job=job)))
+
+
+def flush(bot, context):
+    bot.clock.advance(seconds=bot.CONFIG["notifications"]["coalesce_max_seconds"])
+    run_due_jobs(bot, context)
+    return [text for _, text in context.bot.sent]
+
+
+def test_new_then_cancel_sends_nothing(bot):
+    context = make_context()
+    bot.NotificationSystem.queue(context, "new", booking(bot, 20))
+    bot.NotificationSystem.queue(context, "cancel", dict(booking(bot, 20), status="cancelled"))
+
+    assert flush(bot, context) == []
+    assert not bot.pending_notifications
+
+
+def test_move_and_back_sends_nothing(bot):
+    context = make_context()
+    day = bot.clock.today() + 1
+    bot.NotificationSystem.queue(context, "move", booking(bot, 22), old=(day, 20))
+    bot.NotificationSystem.queue(context, "move", booking(bot, 20), old=(day, 22))
+
+    assert flush(bot, context) == []
+
+
+def test_move_then_cancel_reports_cancel_of_original_time(bot):
+    context = make_context()
+    day = bot.clock.today() + 1
+    bot.NotificationSystem.queue(context, "move", booking(bot, 22), old=(day, 20))
+    bot.NotificationSystem.queue(context, "cancel", dict(booking(bot, 22), status="cancelled"))
+
+    (text,) = flush(bot, context)
+    assert f"❌ {bot.format_date(day, '%d.%m')} 10:00 — {SERVICE}" in text
+    assert "11:00" not in text
+
+
+def test_new_then_move_reports_new_at_final_time(bot):
+    context = make_context()
+    day = bot.clock.today() + 1
+    bot.NotificationSystem.queue(context, "new", booking(bot, 20))
+    bot.NotificationSystem.queue(context, "move", booking(bot, 22), old=(day, 20))
+    bot.NotificationSystem.queue(context, "move", booking(bot, 24, booking_id="b2"), old=(day, 26))
+
+    (text,) = flush(bot, context)
+    date = bot.format_date(day, "%d.%m")
+    assert f"✅ {date} 11:00 — {SERVICE}" in text
+    assert f"🔁 {date} 13:00 → {date} 12:00 — {SERVICE}" in text
+    assert "10:00" not in text
+
+
+def test_steady_changes_flushed_within_max_delay(bot):
+    context = make_context()
+    settings = bot.CONFIG["notifications"]
+    first = bot.clock.now()
+    deadline = first + timedelta(seconds=settings["coalesce_max_seconds"])
+    step = settings["coalesce_seconds"] - 10  # Always inside the quiet period
+
+    for number in range(settings["coalesce_max_seconds"] // step):
+        bot.NotificationSystem.queue(context, "new", booking(bot, 20 + number, booking_id=f"b{number}"))
+        (job,) = context.job_queue.get_jobs_by_name(f"notify_{MASTER}")
+        assert job.due <= deadline
+        bot.clock.advance(seconds=step)
+        run_due_jobs(bot, context)
+
+    assert len(context.bot.sent) == 1
+    assert context.bot.sent[0][0] == bot.CONFIG["masters"][MASTER]["telegram_id"]
+
+
+def test_quiet_period_sends_after_coalesce_seconds(bot):
+    context = make_context()
+    bot.NotificationSystem.queue(context, "new", booking(bot, 20))
+
+    bot.clock.advance(seconds=bot.CONFIG["notifications"]["coalesce_seconds"] - 1)
+    run_due_jobs(bot, context)
+    assert context.bot.sent == []
+
+    bot.clock.advance(seconds=1)
+    run_due_jobs(bot, context)
+    assert len(context.bot.sent) == 1
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import timedelta
+
+from conftest import click, make_context, restart
+
+MASTER = "Дмитрий"
+SERVICE = "Мужская стрижка"
+
+
+def advance_to(bot, days, hour, minute=0):
+    """Move the clock to `hour:minute`, `days` after the current date"""
+    now = bot.clock.now()
+    target = now.replace(hour=hour, minute=minute) + timedelta(days=days)
+    bot.clock.advance(seconds=(target - now).total_seconds())
+
+
+def prompted(context):
+    return [chat_id for chat_id, _ in context.bot.sent]
+
+
+def test_prompt_rate_and_restart(bot, tmp_path, monkeypatch):
+    bot.restore_state()
+    visit = bot.create_booking(5, SERVICE, MASTER, bot.clock.today(), 20)  # 10:00
+    context = make_context()
+
+    advance_to(bot, 0, 11, 0)
+    asyncio.run(bot.RatingSystem.prompt_job(context))
+    assert prompted(context) == []  # Less than prompt_after_minutes since the start
+
+    advance_to(bot, 0, 11, 30)
+    asyncio.run(bot.RatingSystem.prompt_job(context))
+    asyncio.run(bot.RatingSystem.prompt_job(context))
+    assert prompted(context) == [5]
+    assert visit["id"] in bot.pending_ratings
+
+    assert "уже учтена" in click(bot.RatingSystem.handle_rating, 6, f"rate_{visit['id']}_1").text
+    assert "Спасибо" in click(bot.RatingSystem.handle_rating, 5, f"rate_{visit['id']}_4").text
+    assert "уже учтена" in click(bot.RatingSystem.handle_rating, 5, f"rate_{visit['id']}_5").text
+    assert bot.master_rating(MASTER) == (4.0, 1)
+
+    restart(bot, tmp_path, monkeypatch)
+    assert bot.reviews[visit["id"]]["stars"] == 4
+    assert visit["id"] not in bot.pending_ratings
+    assert bot.master_rating(MASTER) == (4.0, 1)
+
+
+def test_evening_visit_prompted_before_nightly_archive(bot):
+    bot.restore_state()
+    visit = bot.create_booking(5, SERVICE, MASTER, bot.clock.today(), 34)  # 17:00
+    context = make_context()
+
+    # Last evening run came too early, the next one is after midnight
+    advance_to(bot, 0, 18, 20)
+    asyncio.run(bot.RatingSystem.prompt_job(context))
+    assert prompted(context) == []
+    advance_to(bot, 1, 0, 5)
+    asyncio.run(bot.archive_job(context))
+
+    assert prompted(context) == [5]
+    assert visit["id"] not in bot.bookings  # Archived after prompting
+    click(bot.RatingSystem.handle_rating, 5, f"rate_{visit['id']}_5")
+    assert bot.master_rating(MASTER) == (5.0, 1)
+
+
+def test_visits_missed_while_down_prompted_on_restart(bot, tmp_path, monkeypatch):
+    bot.restore_state()
+    visit = bot.create_booking(5, SERVICE, MASTER, bot.clock.today(), 20)
+    advance_to(bot, 2, 9, 0)  # Down for two nights
+
+    restart(bot, tmp_path, monkeypatch)
+    assert visit["id"] in bot.bookings  # Not archived before the catch-up run
+    context = make_context()
+    asyncio.run(bot.archive_job(context))
+
+    assert prompted(context) == [5]
+    assert visit["id"] in bot.pending_ratings
+    assert visit["id"] not in bot.bookings
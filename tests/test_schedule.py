@@ -0,0 +1,96 @@
+from datetime import date
+
+import pytest
+
+TODAY = date(2026, 3, 2)  # Monday
+MASTER = "Анна"
+
+
+def parse(bot, text):
+    return bot.ScheduleSystem.parse_dates(text, TODAY)
+
+
+def change(bot, action, text):
+    return bot.ScheduleSystem.apply_change(MASTER, action, text, TODAY)
+
+
+def test_parse_single_day(bot):
+    assert parse(bot, "25.03 10:00-16:00") == ([date(2026, 3, 25)], " 10:00-16:00")
+
+
+def test_parse_day_without_year_rolls_over(bot):
+    assert parse(bot, "01.02")[0] == [date(2027, 2, 1)]
+    assert parse(bot, "01.02.2026")[0] == [date(2026, 2, 1)]
+
+
+def test_parse_range(bot):
+    dates, rest = parse(bot, "30.03-02.04")
+    assert dates == [date(2026, 3, 30), date(2026, 3, 31), date(2026, 4, 1), date(2026, 4, 2)]
+    assert rest == ""
+
+
+def test_parse_weekday_of_month(bot):
+    dates, _ = parse(bot, "Пт 5")
+    assert dates == [date(2026, 5, 1), date(2026, 5, 8), date(2026, 5, 15),
+                     date(2026, 5, 22), date(2026, 5, 29)]
+
+
+@pytest.mark.parametrize("text", ["10.03-05.03", "завтра", "", "31.02"])
+def test_parse_rejects_bad_dates(bot, text):
+    with pytest.raises(ValueError):
+        parse(bot, text)
+
+
+def test_vacation_added_and_removed(bot):
+    _, schedule = change(bot, "off", "10.03-12.03")
+    assert schedule["vacations"] == [{"start": "2026-03-10", "end": "2026-03-12"}]
+    assert bot.working_slots(MASTER, date(2026, 3, 11).toordinal()) == ()
+
+    _, schedule = change(bot, "on", "11.03")
+    assert schedule["vacations"] == [{"start": "2026-03-10", "end": "2026-03-10"},
+                                     {"start": "2026-03-12", "end": "2026-03-12"}]
+    assert bot.working_slots(MASTER, date(2026, 3, 11).toordinal())
+
+
+def test_shift_normalized_and_applied(bot):
+    _, schedule = change(bot, "shift", "10.03 9:00-12:00 перерыв 10:00-10:30")
+    assert schedule["days"]["2026-03-10"] == {"shift": ["09:00", "12:00"],
+                                              "breaks": [["10:00", "10:30"]]}
+    assert bot.working_slots(MASTER, date(2026, 3, 10).toordinal()) == (18, 19, 21, 22, 23)
+
+
+def test_shift_reset(bot):
+    change(bot, "shift", "10.03 09:00-12:00")
+    _, schedule = change(bot, "shift", "10.03 сброс")
+    assert schedule["days"] == {}
+
+
+def test_shift_clamped_to_midnight(bot):
+    _, schedule = change(bot, "shift", "10.03 22:00-24:30")
+    assert schedule["days"]["2026-03-10"]["shift"] == ["22:00", "24:00"]
+    slots = bot.working_slots(MASTER, date(2026, 3, 10).toordinal())
+    assert slots == (44, 45, 46, 47)
+
+
+@pytest.mark.parametrize("text", [
+    "10.03 10:00-25:00",
+    "10.03 12:75-16:00",
+    "10.03 16:00-10:00",
+    "10.03 10:00-16:00 перерыв 09:00-10:30",
+    "10.03 10:00-16:00 перерыв 15:00-17:00",
+    "10.03 10:00-16:00 перерыв 13:00-12:00",
+    "10.03",
+])
+def test_bad_shift_rejected_and_not_journaled(bot, text):
+    with pytest.raises(ValueError):
+        change(bot, "shift", text)
+    assert MASTER not in bot.master_schedules
+    assert bot.journal.seq == 0
+
+
+def test_journaled_shift_past_midnight_stays_in_grid(bot):
+    # Recorded before times were validated
+    bot.record_master_schedule(MASTER, {"vacations": [], "days": {
+        "2026-03-10": {"shift": ["22:00", "25:00"], "breaks": []}}})
+    slots = bot.working_slots(MASTER, date(2026, 3, 10).toordinal())
+    assert slots == (44, 45, 46, 47)
@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+import simulation
+from conftest import reset
+
+
+def simulate(bot, tmp_path, monkeypatch, seed, users=200):
+    reset(bot, tmp_path, monkeypatch)
+    monkeypatch.setattr(bot, "clock", bot.FixedClock(
+        bot.CONFIG["salon_info"]["timezone"], simulation.Simulation.START))
+    sim = simulation.Simulation(users, seed)
+    asyncio.run(sim.run())
+    return sim
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_concurrent_clients_keep_invariants(bot, tmp_path, monkeypatch, seed):
+    sim = simulate(bot, tmp_path, monkeypatch, seed)
+
+    assert sim.check_invariants() == []
+    assert not sim.errors
+    assert sim.counters["conflicts"] > 0  # Clients really competed for slots
+
+
+def test_same_seed_same_outcome(bot, tmp_path, monkeypatch):
+    first = simulate(bot, tmp_path, monkeypatch, 5).fingerprint()
+    second = simulate(bot, tmp_path, monkeypatch, 5).fingerprint()
+    other = simulate(bot, tmp_path, monkeypatch, 6).fingerprint()
+
+    assert first == second
+    assert first != other
@@ -0,0 +1,111 @@
+import asyncio
+from types import SimpleNamespace
+
+from conftest import click, make_context, restart
+
+MASTER = "Дмитрий"
+SERVICE = "Мужская стрижка"
+
+
+def join(bot, user_id, master, day, start="00:00", end="24:00"):
+    entry = {
+        "id": bot.journal.seq + 1, "user_id": user_id, "service": SERVICE, "master": master,
+        "date": bot.iso_date(day), "start": start, "end": end,
+        "created_at": bot.clock.now().isoformat(),
+    }
+    bot.apply_journal_record(bot.journal.append("wait", e=entry))
+    return entry
+
+
+def offer(bot, context, day, slot):
+    asyncio.run(bot.WaitlistSystem.offer_slot(context, MASTER, day, slot))
+
+
+def held_for(bot, day, slot):
+    """User the slot is currently held for"""
+    hold_id = bot.slot_holds.get((MASTER, day), {}).get(slot)
+    return bot.holds[hold_id]["user_id"] if hold_id is not None else None
+
+
+def expire_holds(bot, context):
+    bot.clock.advance(minutes=bot.CONFIG["waitlist"]["hold_minutes"])
+    for job in context.job_queue.pop_due():
+        asyncio.run(job.callback(SimpleNamespace(bot=context.bot, job_queue=context.job_queue, job=job)))
+
+
+def test_offers_go_first_come_first_served_across_buckets(bot):
+    day = bot.clock.today() + 1
+    join(bot, 1, MASTER, day, end="10:00")  # Window does not cover 10:00
+    join(bot, 2, None, day)
+    join(bot, 3, MASTER, day)
+    join(bot, 4, None, day)
+    context = make_context()
+
+    offer(bot, context, day, 20)
+    assert held_for(bot, day, 20) == 2
+
+    click(bot.WaitlistSystem.handle_decline, 2, f"wl_decline_{bot.slot_holds[(MASTER, day)][20]}", context)
+    assert held_for(bot, day, 20) == 3
+
+    click(bot.WaitlistSystem.handle_decline, 3, f"wl_decline_{bot.slot_holds[(MASTER, day)][20]}", context)
+    assert held_for(bot, day, 20) == 4
+    assert [chat_id for chat_id, _ in context.bot.sent] == [2, 3, 4]
+
+
+def test_expired_hold_passes_slot_to_next_entry(bot):
+    day = bot.clock.today() + 1
+    join(bot, 1, MASTER, day)
+    join(bot, 2, MASTER, day)
+    context = make_context()
+    offer(bot, context, day, 20)
+    first_hold = bot.slot_holds[(MASTER, day)][20]
+
+    expire_holds(bot, context)
+
+    assert held_for(bot, day, 20) == 2
+    assert first_hold not in bot.holds
+    query = click(bot.WaitlistSystem.handle_accept, 1, f"wl_accept_{first_hold}", context)
+    assert "истекло" in query.text
+    assert not bot.bookings
+
+    click(bot.WaitlistSystem.handle_accept, 2, f"wl_accept_{bot.slot_holds[(MASTER, day)][20]}", context)
+    (booking,) = bot.bookings.values()
+    assert booking["user_id"] == 2
+    assert not bot.holds and not bot.slot_holds
+    assert bot.WaitlistSystem.user_entries(2) == []
+
+
+def test_stale_decline_keeps_slot_held_for_next_client(bot):
+    day = bot.clock.today() + 1
+    join(bot, 1, MASTER, day)
+    join(bot, 2, MASTER, day)
+    join(bot, 3, MASTER, day)
+    context = make_context()
+    offer(bot, context, day, 20)
+    stale = dict(bot.holds[bot.slot_holds[(MASTER, day)][20]])
+    expire_holds(bot, context)  # Slot re-offered to user 2 under a new hold
+
+    # Declining the expired offer, or releasing it late, must not free the new hold
+    click(bot.WaitlistSystem.handle_decline, 1, f"wl_decline_{stale['id']}", context)
+    bot.WaitlistSystem.release_hold(context, stale)
+
+    assert held_for(bot, day, 20) == 2
+    assert not bot.is_slot_free(MASTER, day, 20)
+    assert [chat_id for chat_id, _ in context.bot.sent] == [1, 2]
+
+
+def test_user_entries_follow_per_user_index(bot, tmp_path, monkeypatch):
+    bot.restore_state()
+    today = bot.clock.today()
+    later = join(bot, 1, MASTER, today + 3)
+    sooner = join(bot, 1, None, today + 1)
+    other = join(bot, 2, MASTER, today + 1)
+
+    assert bot.WaitlistSystem.user_entries(1) == [sooner, later]
+    bot.apply_journal_record(bot.journal.append("unwait", id=sooner["id"]))
+    assert bot.WaitlistSystem.user_entries(1) == [later]
+
+    restart(bot, tmp_path, monkeypatch)
+    assert bot.WaitlistSystem.user_entries(1) == [later]
+    assert bot.WaitlistSystem.user_entries(2) == [other]
+    assert bot.user_waitlist_index == {1: {later["id"]}, 2: {other["id"]}}